@@ -0,0 +1,100 @@
+TOTAL_HEADER = 'Всего'
+GOALIES_HEADER = 'Вратари'
+
+
+class AttendanceMatrix:
+    """Локальная копия листа посещаемости.
+
+    Хранит значения ячеек и индексы "заголовок -> столбец" и "ФИО -> строка",
+    чтобы отметка посещения была изменением в памяти, а не чтением листа.
+    Индексы строк и столбцов - с нуля, строка 0 - заголовки.
+    """
+
+    def __init__(self, rows):
+        self.rows = [list(row) for row in rows] or [['ФИО']]
+        self.col_by_header = {}
+        self.row_by_name = {}
+        self._reindex_columns()
+        self._reindex_rows()
+        self._pad_rows()
+
+    @property
+    def headers(self):
+        return self.rows[0]
+
+    @property
+    def total_col(self):
+        return self.col_by_header[TOTAL_HEADER]
+
+    def _reindex_columns(self):
+        self.col_by_header = {header: i for i, header in enumerate(self.headers) if header}
+
+    def _reindex_rows(self):
+        self.row_by_name = {row[0]: i for i, row in enumerate(self.rows) if i > 0 and row and row[0]}
+
+    def _pad_rows(self):
+        width = len(self.headers)
+        for row in self.rows:
+            if len(row) < width:
+                row.extend([''] * (width - len(row)))
+
+    def ensure_totals(self):
+        """Добавляет столбцы "Всего" и "Вратари" в конец. True - если заголовки изменились"""
+        changed = False
+        if TOTAL_HEADER not in self.col_by_header:
+            self.headers.append(TOTAL_HEADER)
+            changed = True
+        if len(self.headers) <= self.total_col + 1:
+            self.headers.append(GOALIES_HEADER)
+            changed = True
+        if changed:
+            self._reindex_columns()
+            self._pad_rows()
+        return changed
+
+    def ensure_column(self, date_str):
+        """Возвращает (индекс столбца даты, создан ли он). Новые даты - перед "Всего" """
+        if date_str in self.col_by_header:
+            return self.col_by_header[date_str], False
+
+        self.ensure_totals()
+        col_idx = self.total_col
+        self.headers.insert(col_idx, date_str)
+        for row in self.rows[1:]:
+            row.insert(col_idx, '')
+        self._reindex_columns()
+        return col_idx, True
+
+    def delete_column(self, col_idx):
+        """Удаляет столбец со сдвигом влево"""
+        for row in self.rows:
+            if len(row) > col_idx:
+                del row[col_idx]
+        self._reindex_columns()
+
+    def ensure_row(self, name):
+        """Возвращает (индекс строки игрока, создана ли она)"""
+        if name in self.row_by_name:
+            return self.row_by_name[name], False
+
+        self.rows.append([name] + [''] * (len(self.headers) - 1))
+        row_idx = self.row_by_name[name] = len(self.rows) - 1
+        return row_idx, True
+
+    def get_value(self, row_idx, col_idx):
+        return self.rows[row_idx][col_idx]
+
+    def set_value(self, row_idx, col_idx, value):
+        """Меняет ячейку. True - если значение изменилось"""
+        if self.rows[row_idx][col_idx] == value:
+            return False
+        self.rows[row_idx][col_idx] = value
+        return True
+
+    def recount(self, row_idx):
+        """Пересчитывает "Всего" и "Вратари" для строки, возвращает пару значений"""
+        row = self.rows[row_idx]
+        total_col = self.total_col
+        row[total_col] = sum(1 for val in row[1:total_col] if val == '1')
+        row[total_col + 1] = sum(1 for val in row[1:total_col] if val == 'G')
+        return row[total_col], row[total_col + 1]
@@ -1,34 +1,66 @@
+import atexit
 import os
 import re
-import threading
-from threading import Timer
-
-import telebot
+import sys
 
+import config
 from config import ADMIN_IDS, CONFIG_ADMINS, TELEGRAM_TOKEN, TRAINING_CHAT_ID_STAGING, TRAINING_CHAT_ID_TEST, \
     NOTIFICATION_TO, BIG_CHAT_ID_TEST, TRAINING_CHAT_ID_PROD, BIG_CHAT_ID_PROD
-from gsheets import GoogleSheetsClient
+from gsheets import GoogleSheetsClient, LazySheetsClient, TOKEN_REFRESH_INTERVAL, USERS_REFRESH_INTERVAL
+from lanes import LanePool, UPDATE_LANES
+from outbound import PacedTeleBot
+from router import CallbackRouter, MessageRouter
+from roster import SECTION_NAMES, Training, TrainingMessageIndex, TrainingRegistry
+from scheduler import Scheduler
+from sheets_outbox import OutboxJournal, SheetsOutbox
+from sqlite_storage import SqliteStorage
+from state_store import StateStore
 from templates_manager import TemplatesManager
+from webhook import ALLOWED_UPDATES, WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT, WebhookServer
 
 #TRAINING_CHAT_ID = TRAINING_CHAT_ID_TEST
 #BIG_CHAT_ID = BIG_CHAT_ID_TEST
 TRAINING_CHAT_ID = TRAINING_CHAT_ID_PROD
 BIG_CHAT_ID = BIG_CHAT_ID_PROD
-gsheets = GoogleSheetsClient()
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
-templates_manager = TemplatesManager()
 
-# Глобальная переменная для хранения состояния ожидания даты
-waiting_for_date = {}
+# Состояние бота хранится в локальной базе и переживает перезапуск
+state_store = StateStore()
+
+# Все отложенные действия выполняет один поток планировщика
+scheduler = Scheduler(state_store.dict('scheduled_jobs'))
+
+# Пользователи и посещаемость: Google-таблица или локальная SQLite
+if getattr(config, 'STORAGE_BACKEND', 'sheets') == 'sqlite':
+    storage = SqliteStorage()
+    # Таблица остается отчетом и заполняется фоном; подключение - при первой записи
+    sheets = LazySheetsClient() if getattr(config, 'SHEETS_REPORT', True) else None
+    sheets_outbox = SheetsOutbox(sheets, OutboxJournal(), local=storage)
+else:
+    storage = sheets = GoogleSheetsClient()
+    # Изменения таблицы сначала пишутся в локальный журнал, в Google - фоном
+    sheets_outbox = SheetsOutbox(sheets, OutboxJournal())
+bot = PacedTeleBot(TELEGRAM_TOKEN, call_later=scheduler.call_later, threaded=False)
+# Апдейты разных пользователей обрабатываются параллельно, одного - по порядку
+update_lanes = LanePool(getattr(config, 'UPDATE_LANES', UPDATE_LANES))
+update_lanes.install(bot)
+# Кнопки и текстовые сообщения без команд маршрутизируются словарем, а не цепочкой фильтров
+callback_router = CallbackRouter()
+message_router = MessageRouter(lambda m: training_states.get(m.from_user.id, {}).get('step'))
+templates_manager = TemplatesManager()
 
-# Глобальный словарь для хранения состояния создания тренировки
+# Глобальный словарь для хранения состояния создания тренировки.
+# Только в памяти: шаги диалога ведут next-step обработчики, которые не
+# переживают перезапуск, поэтому и начатые диалоги после него не продолжаются
 training_states = {}
 
-# Глобальное хранилище сообщений о тренировках
-training_messages_store = {}
+# Опубликованные сообщения тренировок: дата -> сообщения и сообщение -> дата
+training_messages = TrainingMessageIndex(state_store.dict('training_messages'))
 
 # Глобальный словарь для хранения ожидающих подтверждений
-pending_reserve_confirmations = {}
+pending_reserve_confirmations = state_store.dict('pending_reserve_confirmations')
+
+# Составы тренировок по (chat_id, message_id) опубликованного сообщения
+trainings = TrainingRegistry(storage.get_user_id_by_name, state_store.dict('trainings'))
 
 def is_admin(user_id):
     """Проверка прав администратора"""
@@ -122,7 +154,7 @@ def delete_template(message):
 
 
 # Обработчик кнопок удаления шаблонов
-@bot.callback_query_handler(func=lambda call: call.data.startswith('delete_template_'))
+@callback_router.route('delete_template_')
 def confirm_delete_template(call):
     template_name = call.data.replace('delete_template_', '')
 
@@ -143,7 +175,7 @@ def confirm_delete_template(call):
 
 
 # Обработчик подтверждения удаления
-@bot.callback_query_handler(func=lambda call: call.data.startswith('confirm_delete_'))
+@callback_router.route('confirm_delete_')
 def execute_delete_template(call):
     template_name = call.data.replace('confirm_delete_', '')
 
@@ -163,7 +195,7 @@ def execute_delete_template(call):
 
 
 # Обработчик отмены удаления
-@bot.callback_query_handler(func=lambda call: call.data == "cancel_delete")
+@callback_router.route('cancel_delete', exact=True)
 def cancel_delete_template(call):
     bot.edit_message_text(
         chat_id=call.message.chat.id,
@@ -190,7 +222,7 @@ def list_templates(message):
 
 
 # Обработчик для кнопок просмотра шаблонов
-@bot.callback_query_handler(func=lambda call: call.data.startswith('show_template_'))
+@callback_router.route('show_template_')
 def show_template(call):
     template_name = call.data.replace('show_template_', '')
     try:
@@ -306,35 +338,41 @@ def process_players_list(message):
         if message.text.strip() == '0':
             return finalize_training_creation(message)
 
-        # Обрабатываем список игроков
+        # Очищаем ФИО от нумерации (1., 2. и т.д.) и спецсимволов
+        names = [storage.clean_name(line) for line in message.text.split('\n')]
+
+        # Весь список сопоставляется с одним снимком пользователей за один проход
         players_list = []
         unregistered_players = []
-
-        for line in message.text.split('\n'):
-            if not line.strip():
-                continue
-
-            # Очищаем ФИО от нумерации (1., 2. и т.д.) и спецсимволов
-            clean_line = re.sub(r'^\d+\.?\s*', '', line.strip())  # Удаляем нумерацию
-            clean_name = re.sub(r'[^a-zA-Zа-яА-ЯёЁ\s]', '', clean_line).strip()
-
-            if not clean_name:
-                continue
-
-            # Ищем пользователя
-            user_data = gsheets.find_user_by_name(clean_name)
-            if not user_data or not user_data.get('user_id'):
+        ambiguous_players = []
+        for clean_name, player_ids in storage.resolve_names([name for name in names if name]):
+            if not player_ids:
                 unregistered_players.append(clean_name)
                 continue
+            if len(player_ids) > 1:
+                ambiguous_players.append(clean_name)
+                continue
 
             players_list.append({
                 'name': clean_name,
-                'user_id': user_data['user_id']
+                'user_id': player_ids[0]
             })
 
+        # Если ФИО есть у нескольких зарегистрированных, угадывать нельзя
+        if ambiguous_players:
+            error_msg = ("❌ Эти ФИО есть у нескольких игроков - уберите их из списка, они запишутся сами кнопкой:\n"
+                         + "\n".join(ambiguous_players))
+            bot.reply_to(message, error_msg)
+            return None
+
         # Если есть незарегистрированные игроки
         if unregistered_players:
-            error_msg = "❌ Эти игроки не зарегистрированы:\n" + "\n".join(unregistered_players)
+            lines = []
+            for name in unregistered_players:
+                # Подсказываем похожие ФИО: опечатки, сокращения
+                suggestions = list(dict.fromkeys(similar for similar, _, _ in storage.similar_names(name)))
+                lines.append(f"{name} (возможно: {', '.join(suggestions)})" if suggestions else name)
+            error_msg = "❌ Эти игроки не зарегистрированы:\n" + "\n".join(lines)
             bot.reply_to(message, error_msg)
             return None
 
@@ -397,7 +435,26 @@ def process_date_input(message):
         )
 
 
-@bot.message_handler(func=lambda m: training_states.get(m.from_user.id, {}).get('step') == 'confirm_creation')
+def training_markup(chat_id):
+    """Клавиатура записи; в чате предзаписи - с кнопкой её завершения"""
+    markup = types.InlineKeyboardMarkup()
+    markup.row(
+        types.InlineKeyboardButton("Игрок", callback_data='train_role_player'),
+        types.InlineKeyboardButton("Вратарь", callback_data='train_role_goalie')
+    )
+    if chat_id == TRAINING_CHAT_ID:
+        markup.row(
+            types.InlineKeyboardButton("❌ Отменить запись", callback_data='train_cancel'),
+            types.InlineKeyboardButton("✅ Завершить предзапись", callback_data='finish_prereg')
+        )
+    else:
+        markup.row(
+            types.InlineKeyboardButton("❌ Отменить запись", callback_data='train_cancel')
+        )
+    return markup
+
+
+@message_router.on_step('confirm_creation')
 def finalize_training_creation(message):
     try:
         if message.text == "❌ Отмена":
@@ -413,47 +470,34 @@ def finalize_training_creation(message):
         template = templates_manager.get_template(state['template_name'])
 
         # Формируем текст тренировки
-        train_text = template.format(
+        header_text = template.format(
             date=state['date'],
             location="[место из шаблона]",
             details="[детали из шаблона]"
-        ) + f"\n\nЛимит игроков: {state.get('player_limit', 0)}\n\nСписок красавчиков:\nИгроки:\nВратари:\nРезерв:"
-
-        # Добавляем предопределенных игроков
-        if 'predefined_players' in state:
-            players = []
-            for player in state['predefined_players']:
-                players.append(f"{len(players) + 1}. {player['name']}")
-                gsheets.update_attendance(
-                    player['user_id'],
-                    datetime.strptime(state['date'], '%d.%m.%Y %H:%M').date(),
-                    present=True,
-                    role='player'
-                )
-
-            train_text = train_text.replace("Игроки:", f"Игроки:\n" + "\n".join(players))
-
-        # Создаем клавиатуру с кнопкой завершения предзаписи
-        markup = types.InlineKeyboardMarkup()
-        markup.row(
-            types.InlineKeyboardButton("Игрок", callback_data='train_role_player'),
-            types.InlineKeyboardButton("Вратарь", callback_data='train_role_goalie')
-        )
-        markup.row(
-            types.InlineKeyboardButton("❌ Отменить запись", callback_data='train_cancel'),
-            types.InlineKeyboardButton("✅ Завершить предзапись", callback_data='finish_prereg')
-        )
+        ) + f"\n\nЛимит игроков: {state.get('player_limit', 0)}\n\nСписок красавчиков:"
+        training_date = datetime.strptime(state['date'], '%d.%m.%Y %H:%M')
+        training = Training(TRAINING_CHAT_ID, None, training_date, header_text, state.get('player_limit', 0))
+
+        # Добавляем предопределенных игроков, посещаемость пишем одной пачкой
+        seeded = []
+        for player in state.get('predefined_players', []):
+            training.add(player['user_id'], player['name'], role='player')
+            seeded.append((player['user_id'], training_date.date(), True, 'player'))
+        if seeded:
+            sheets_outbox.submit_attendance_batch(seeded)
 
         # Публикуем сообщение в чате предварительной записи
         sent_message = bot.send_message(
             chat_id=TRAINING_CHAT_ID,
-            text=train_text,
-            reply_markup=markup
+            text=training.render(),
+            reply_markup=training_markup(TRAINING_CHAT_ID)
         )
 
         # Сохраняем данные сообщения
         state['pre_reg_message_id'] = sent_message.message_id
-        store_training_message(sent_message)
+        training.message_id = sent_message.message_id
+        trainings.add(training)
+        training_messages.add(training.date_str, sent_message.chat.id, sent_message.message_id)
 
         bot.send_message(
             message.chat.id,
@@ -469,7 +513,7 @@ def finalize_training_creation(message):
 
 
 # Обработчик кнопки завершения предзаписи
-@bot.callback_query_handler(func=lambda call: call.data == 'finish_prereg')
+@callback_router.route('finish_prereg', exact=True)
 def handle_finish_preregistration(call):
     try:
         # Проверяем права администратора
@@ -477,46 +521,33 @@ def handle_finish_preregistration(call):
             bot.answer_callback_query(call.id, "⛔ Недостаточно прав!", show_alert=True)
             return
 
-        # Получаем текст и данные сообщения
-        message_text = call.message.text
-        date_match = re.search(r'(\d{2}\.\d{2}\.\d{4})', message_text)
-        if not date_match:
-            raise ValueError("Не удалось определить дату тренировки")
-
-        date_str = date_match.group(1)
-
-        # Создаем клавиатуру для основного чата
-        markup = types.InlineKeyboardMarkup()
-        markup.row(
-            types.InlineKeyboardButton("Игрок", callback_data='train_role_player'),
-            types.InlineKeyboardButton("Вратарь", callback_data='train_role_goalie')
-        )
-        markup.row(
-            types.InlineKeyboardButton("❌ Отменить запись", callback_data='train_cancel')
-        )
-
-        # Публикуем сообщение в основном чате
-        new_message = bot.send_message(
-            chat_id=BIG_CHAT_ID,
-            text=message_text,
-            reply_markup=markup
-        )
-
-        # Сохраняем новое сообщение в хранилище
-        store_training_message(new_message)
+        with trainings.lock(call.message.chat.id, call.message.message_id):
+            # Получаем состав тренировки
+            training = trainings.get_for_message(call.message)
+            if training is None:
+                bot.answer_callback_query(call.id, "❌ Тренировка уже перенесена или отменена")
+                return
+            date_str = training.date_str
+
+            # Публикуем сообщение в основном чате
+            new_message = bot.send_message(
+                chat_id=BIG_CHAT_ID,
+                text=training.render(),
+                reply_markup=training_markup(BIG_CHAT_ID)
+            )
 
-        # Удаляем сообщение из чата предварительной записи
-        bot.delete_message(
-            chat_id=TRAINING_CHAT_ID,
-            message_id=call.message.message_id
-        )
+            # Сохраняем новое сообщение в индексе и переносим состав
+            training_messages.add(date_str, new_message.chat.id, new_message.message_id)
+            trainings.add(training.copy_to(new_message.chat.id, new_message.message_id))
 
-        # Обновляем хранилище - удаляем старое сообщение
-        if date_str in training_messages_store:
-            training_messages_store[date_str] = [
-                msg for msg in training_messages_store[date_str]
-                if msg['message_id'] != call.message.message_id
-            ]
+            # Удаляем сообщение из чата предварительной записи
+            bot.delete_message(
+                chat_id=TRAINING_CHAT_ID,
+                message_id=call.message.message_id
+            )
+            bot.edits.forget(call.message.chat.id, call.message.message_id)
+            trainings.remove(call.message.chat.id, call.message.message_id)
+            training_messages.remove_message(call.message.chat.id, call.message.message_id)
 
         bot.answer_callback_query(call.id, "✅ Предзапись завершена, сообщение перемещено в основной чат")
 
@@ -524,182 +555,62 @@ def handle_finish_preregistration(call):
         print(f"Ошибка завершения предзаписи: {e}")
         bot.answer_callback_query(call.id, "❌ Ошибка при завершении предзаписи")
 
-@bot.message_handler(func=lambda m: m.chat.id == TRAINING_CHAT_ID and "тренировка" in m.text.lower())
-def handle_training_message(message):
-    """Перехватывает все сообщения о тренировках и сохраняет их"""
-    store_training_message(message)
-
-
-@bot.callback_query_handler(func=lambda call: call.data == 'train_cancel')
+@callback_router.route('train_cancel', exact=True)
 def handle_cancel_registration(call):
-    global training_date
     try:
         # 1. Получаем информацию о пользователе
         user = call.from_user
-        user_data = gsheets.get_user_record(user.id)
+        user_data = storage.get_user_record(user.id)
 
         if not user_data or not user_data.get('message'):
             bot.answer_callback_query(call.id, "❌ Ваши данные не найдены", show_alert=True)
             return
 
-        user_message = user_data['message']
-        message_id = call.message.message_id
-        chat_id = call.message.chat.id
-
-        # 2. Разбираем сообщение о тренировке
-        lines = call.message.text.split('\n')
-        players = []
-        reserves = []
-        goalies = []
-        other_lines = []
-        current_section = None
-        found_in_players = False
-        found_in_reserves = False
-        found_in_goalies = False
-        player_number = None
-        player_limit = 0
-
-        # 3. Парсим лимит игроков
-        for line in lines:
-            if "Лимит игроков:" in line:
-                try:
-                    player_limit = int(line.split(":")[1].strip())
-                except:
-                    player_limit = 0
-                break
-
-        # 4. Анализируем списки участников
-        for line in lines:
-            if "Игроки:" in line:
-                current_section = "players"
-                other_lines.append(line)
-            elif "Резерв:" in line:
-                current_section = "reserves"
-                other_lines.append(line)
-            elif "Вратари:" in line:
-                current_section = "goalies"
-                other_lines.append(line)
-            elif line.strip().startswith(('1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.')):
-                if user_message in line:
-                    # Запоминаем номер игрока
-                    player_number = line.split('.')[0].strip()
-                    if current_section == "players":
-                        found_in_players = True
-                    elif current_section == "reserves":
-                        found_in_reserves = True
-                    elif current_section == "goalies":
-                        found_in_goalies = True
-                    continue
-
-                if current_section == "players":
-                    players.append(line)
-                elif current_section == "reserves":
-                    reserves.append(line)
-                elif current_section == "goalies":
-                    goalies.append(line)
-            else:
-                other_lines.append(line)
-
-        # 5. Проверяем, был ли пользователь записан
-        if not (found_in_players or found_in_reserves or found_in_goalies):
-            bot.answer_callback_query(call.id, "⚠ Вы не были записаны на эту тренировку", show_alert=True)
-            return
+        with trainings.lock(call.message.chat.id, call.message.message_id):
+            # 2. Получаем состав тренировки и убираем из него пользователя
+            training = trainings.get_for_message(call.message)
+            if training is None:
+                bot.answer_callback_query(call.id, "❌ Тренировка уже перенесена или отменена", show_alert=True)
+                return
+            had_reserves = bool(training.reserves)
+            section, player_number = training.remove(user.id)
+
+            # 3. Проверяем, был ли пользователь записан
+            if section is not None:
+                trainings.save(training)
+
+                # 4. Обновляем сообщение о тренировке (правки схлопываются)
+                bot.queue_edit(
+                    chat_id=training.chat_id,
+                    message_id=training.message_id,
+                    text=training.render(),
+                    reply_markup=call.message.reply_markup
+                )
 
-        # 6. Получаем дату тренировки
-        for line in call.message.text.split('\n'):
-            if 'тренировка' in line.lower():
-                date_str = line.split('тренировка')[1].strip().split()[0]
-                training_date = datetime.strptime(date_str, '%d.%m.%Y')
-                break
-
-        # 7. Обработка разных сценариев отмены
-        if found_in_players and reserves:
-            # Сценарий 1: Отмена основного игрока с резервом
-            training_info = {
-                'original_message_id': message_id,
-                'chat_id': chat_id,
-                'training_date': training_date,
-                'players_list': players,
-                'reserves_list': reserves,
-                'goalies_list': goalies,
-                'other_lines': other_lines,
-                'player_limit': player_limit,
-                'reply_markup': call.message.reply_markup
-            }
-            send_reserve_confirmation(training_info, reserves[0], 0)
-
-            # Пока оставляем списки без изменений (ждем подтверждения)
-            new_text = []
-            for line in other_lines:
-                if line == "Игроки:":
-                    new_text.append(line)
-                    new_text.extend(players)
-                elif line == "Резерв:":
-                    new_text.append(line)
-                    new_text.extend(reserves)
-                elif line == "Вратари:":
-                    new_text.append(line)
-                    new_text.extend(goalies)
-                else:
-                    new_text.append(line)
-        else:
-            # Сценарий 2: Нет резерва или отменяет не основной игрок
-            # Формируем новые списки без этого пользователя
-
-            # Пересчитываем нумерацию
-            players_renumbered = []
-            for i, player in enumerate(players, 1):
-                parts = player.split('.', 1)
-                players_renumbered.append(f"{i}.{parts[1]}")
-
-            reserves_renumbered = []
-            for i, reserve in enumerate(reserves, 1):
-                parts = reserve.split('.', 1)
-                reserves_renumbered.append(f"{i}.{parts[1]}")
-
-            goalies_renumbered = []
-            for i, goalie in enumerate(goalies, 1):
-                parts = goalie.split('.', 1)
-                goalies_renumbered.append(f"{i}.{parts[1]}")
-
-            # Формируем новое сообщение
-            new_text = []
-            for line in other_lines:
-                if line == "Игроки:":
-                    new_text.append(line)
-                    new_text.extend(players_renumbered)
-                elif line == "Резерв:":
-                    new_text.append(line)
-                    new_text.extend(reserves_renumbered)
-                elif line == "Вратари:":
-                    new_text.append(line)
-                    new_text.extend(goalies_renumbered)
-                else:
-                    new_text.append(line)
-
-        # 8. Обновляем сообщение о тренировке
-        bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=message_id,
-            text='\n'.join(new_text),
-            reply_markup=call.message.reply_markup
-        )
+                # 5. Посещаемость пишется в таблицу фоном
+                sheets_outbox.submit_attendance(user.id, training.training_date, present=False)
 
-        # 9. Обновляем посещаемость
-        gsheets.update_attendance(user.id, training_date, present=False)
+        if section is None:
+            bot.answer_callback_query(call.id, "⚠ Вы не были записаны на эту тренировку", show_alert=True)
+            return
 
-        # 10. Уведомляем пользователя
+        # 6. Сразу отвечаем пользователю, остальное - после ответа
         bot.answer_callback_query(call.id, "✅ Ваша запись отменена!")
 
-        player_name = user_data.get('message', user_data.get('message', 'Неизвестный игрок'))
-        section_name = 'основном составе' if found_in_players else 'резерве' if found_in_reserves else 'вратарях'
+        # 7. Если ушел основной игрок - предлагаем место первому резервисту
+        if section == 'players' and had_reserves:
+            with trainings.lock(training.chat_id, training.message_id):
+                if training.reserves and trainings.is_current(training):
+                    send_reserve_confirmation(training, 0)
+
+        player_name = user_data.get('message', 'Неизвестный игрок')
 
         # Формируем текст уведомления с номером игрока
         notification_text = (
             f"⚠️ Игрок отменил запись на тренировку\n"
-            f"Дата: {training_date.strftime('%d.%m.%Y')}\n"
+            f"Дата: {training.date_str}\n"
             f"Игрок: {player_name}\n"
-            f"Был в: {section_name}\n"
+            f"Был в: {SECTION_NAMES[section]}\n"
             f"Номер в списке: {player_number}"  # Добавлен номер игрока
         )
         send_admin_notification(notification_text)
@@ -709,45 +620,46 @@ def handle_cancel_registration(call):
         bot.answer_callback_query(call.id, "❌ Ошибка сервера")
 
 
-def send_reserve_confirmation(training_info, reserve_player, reserve_index):
+def send_reserve_confirmation(training, reserve_index):
     """Отправляет запрос подтверждения резервисту"""
     try:
-        # Удаляем "(резерв)" из имени игрока перед поиском
-        clean_player_name = reserve_player.split('.', 1)[1].strip().replace('(резерв)', '').strip()
-        reserve_user_id = gsheets.get_user_id_by_name(clean_player_name)
+        reserve = training.reserves[reserve_index]
+        reserve_user_id = reserve['user_id']
 
         if not reserve_user_id:
-            print(f"Не найден user_id для резервиста: {clean_player_name}")
+            print(f"Не найден user_id для резервиста: {reserve['name']}")
             return
 
         # Создаем клавиатуру подтверждения
         markup = types.InlineKeyboardMarkup()
         confirm_btn = types.InlineKeyboardButton(
             text="✅ Подтвердить переход",
-            callback_data=f"reserve_confirm_{training_info['original_message_id']}"
+            callback_data=f"reserve_confirm_{training.message_id}"
         )
         markup.add(confirm_btn)
 
         # Отправляем сообщение
         sent_msg = bot.send_message(
             reserve_user_id,
-            f"Вы первый в резерве на тренировку {training_info['training_date'].strftime('%d.%m.%Y')}.\n"
+            f"Вы первый в резерве на тренировку {training.date_str}.\n"
             "Хотите перейти в основной состав?",
             reply_markup=markup
         )
 
         # Сохраняем информацию о запросе
-        pending_reserve_confirmations[training_info['original_message_id']] = {
-            'training_info': training_info,
+        pending_reserve_confirmations[training.message_id] = {
+            'chat_id': training.chat_id,
             'reserve_index': reserve_index,
             'reserve_user_id': reserve_user_id,
-            'reserve_player_name': clean_player_name,  # Сохраняем очищенное имя
+            'reserve_player_name': reserve['name'],
             'confirmation_msg_id': sent_msg.message_id,
             'timestamp': datetime.now()
         }
 
-        # Устанавливаем таймер на 1 час
-        Timer(3600, check_reserve_confirmation, [training_info['original_message_id']]).start()
+        # Через 1 час проверяем, подтвердил ли резервист переход
+        timer = scheduler.schedule(3600, 'check_reserve_confirmation', training.message_id)
+        pending_reserve_confirmations[training.message_id]['timer_job_id'] = timer.job_id
+        pending_reserve_confirmations.save(training.message_id)
 
     except Exception as e:
         print(f"Ошибка отправки подтверждения резервисту: {e}")
@@ -758,19 +670,21 @@ def check_reserve_confirmation(message_id):
     if message_id not in pending_reserve_confirmations:
         return
 
-    confirmation_data = pending_reserve_confirmations[message_id]
-    training_info = confirmation_data['training_info']
-    reserve_index = confirmation_data['reserve_index']
+    confirmation_data = pending_reserve_confirmations.pop(message_id, None)
+    training = trainings.get(confirmation_data['chat_id'], message_id) if confirmation_data else None
+    if training is None:
+        return
 
     # Если подтверждения не было, пробуем следующего резервиста
-    if len(training_info['reserves_list']) > reserve_index + 1:
-        send_reserve_confirmation(training_info, training_info['reserves_list'][reserve_index + 1], reserve_index + 1)
-
-    # Удаляем старый запрос
-    pending_reserve_confirmations.pop(message_id, None)
+    with trainings.lock(training.chat_id, training.message_id):
+        if not trainings.is_current(training):
+            return
+        reserve_index = confirmation_data['reserve_index']
+        if len(training.reserves) > reserve_index + 1:
+            send_reserve_confirmation(training, reserve_index + 1)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('reserve_confirm_'))
+@callback_router.route('reserve_confirm_')
 def handle_reserve_confirmation(call):
     try:
         message_id = int(call.data.split('_')[-1])
@@ -778,53 +692,41 @@ def handle_reserve_confirmation(call):
             bot.answer_callback_query(call.id, "❌ Запрос устарел")
             return
 
-        confirmation_data = pending_reserve_confirmations.pop(message_id)
-        training_info = confirmation_data['training_info']
-        reserve_player = training_info['reserves_list'][confirmation_data['reserve_index']]
+        confirmation_data = pending_reserve_confirmations.pop(message_id, None)
+        if confirmation_data and confirmation_data.get('timer_job_id'):
+            scheduler.cancel(confirmation_data['timer_job_id'])
+
+        training = trainings.get(confirmation_data['chat_id'], message_id) if confirmation_data else None
+        if training is None:
+            bot.answer_callback_query(call.id, "❌ Запрос устарел")
+            return
+
         reserve_user_id = confirmation_data['reserve_user_id']
+        with trainings.lock(training.chat_id, training.message_id):
+            # Удаляем из резерва и добавляем в основной состав (если тренировку не отменили)
+            promoted = trainings.is_current(training) and training.promote_reserve(reserve_user_id)
+            if promoted:
+                trainings.save(training)
+
+                # Обновляем сообщение о тренировке и посещаемость
+                bot.queue_edit(
+                    chat_id=training.chat_id,
+                    message_id=training.message_id,
+                    text=training.render(),
+                    reply_markup=training_markup(training.chat_id)
+                )
+                sheets_outbox.submit_attendance(
+                    reserve_user_id,
+                    training.training_date,
+                    present=True,
+                    role='player'
+                )
 
-        # Обновляем списки
-        players = training_info['players_list']
-        reserves = training_info['reserves_list']
-
-        # Удаляем из резерва и добавляем в основной состав
-        reserves.pop(confirmation_data['reserve_index'])
-        players.append(f"{len(players) + 1}. {reserve_player.split('.', 1)[1].strip().replace('(резерв)', '')}")
-
-        # Пересчитываем нумерацию
-        players_renumbered = [f"{i}.{p.split('.', 1)[1]}" for i, p in enumerate(players, 1)]
-        reserves_renumbered = [f"{i}.{r.split('.', 1)[1]}" for i, r in enumerate(reserves, 1)]
-
-        # Формируем новое сообщение
-        new_text = []
-        for line in training_info['other_lines']:
-            if line == "Игроки:":
-                new_text.append(line)
-                new_text.extend(players_renumbered)
-            elif line == "Резерв:":
-                new_text.append(line)
-                new_text.extend(reserves_renumbered)
-            elif line == "Вратари:":
-                new_text.append(line)
-                new_text.extend(training_info['goalies_list'])
-            else:
-                new_text.append(line)
-
-        # Обновляем сообщение о тренировке
-        bot.edit_message_text(
-            chat_id=training_info['chat_id'],
-            message_id=training_info['original_message_id'],
-            text='\n'.join(new_text),
-            reply_markup=training_info['reply_markup']
-        )
+        if not promoted:
+            bot.answer_callback_query(call.id, "❌ Запрос устарел")
+            return
 
-        # Обновляем посещаемость
-        gsheets.update_attendance(
-            reserve_user_id,
-            training_info['training_date'],
-            present=True,
-            role='player'
-        )
+        bot.answer_callback_query(call.id, "✅ Вы в основном составе!")
 
         # Уведомляем резервиста
         bot.edit_message_text(
@@ -835,8 +737,8 @@ def handle_reserve_confirmation(call):
 
         notification_text = (
             f"🔄 Игрок перешел из резерва в основной состав\n"
-            f"Дата: {training_info['training_date'].strftime('%d.%m.%Y')}\n"
-            f"Игрок: {reserve_player}"
+            f"Дата: {training.date_str}\n"
+            f"Игрок: {confirmation_data['reserve_player_name']}"
         )
         send_admin_notification(notification_text)
 
@@ -845,80 +747,6 @@ def handle_reserve_confirmation(call):
         bot.answer_callback_query(call.id, "❌ Ошибка сервера")
 
 
-def store_training_message(message):
-    """Сохраняет сообщение о тренировке с учетом чата"""
-    try:
-        date_match = re.search(r'(\d{2}\.\d{2}\.\d{4})', message.text)
-        if date_match:
-            date_str = date_match.group(1)
-            if date_str not in training_messages_store:
-                training_messages_store[date_str] = []
-
-            training_messages_store[date_str].append({
-                'chat_id': message.chat.id,  # Сохраняем ID чата
-                'message_id': message.message_id,
-                'text': message.text
-            })
-    except Exception as e:
-        print(f"Ошибка сохранения сообщения: {e}")
-
-
-def find_training_message(chat_id, training_date):
-    """Ищет сообщение о тренировке по дате в истории чата"""
-    try:
-        # Формируем строку для поиска (дата в формате сообщения)
-        search_date = training_date.strftime('%d.%m.%Y')
-
-        # Получаем последние 100 сообщений (можно увеличить при необходимости)
-        messages = bot.get_chat_history(chat_id, limit=100)
-
-        for msg in messages:
-            if msg.text and search_date in msg.text and "тренировка" in msg.text.lower():
-                return {
-                    'chat_id': chat_id,
-                    'message_id': msg.message_id,
-                    'text': msg.text
-                }
-        return None
-    except Exception as e:
-        print(f"Ошибка поиска сообщения: {e}")
-        return None
-
-
-def find_all_training_messages(chat_id, training_date):
-    """Находит все сообщения о тренировке (основное и возможно дополнения)"""
-    try:
-        search_date = training_date.strftime('%d.%m.%Y')
-        messages = bot.get_chat_history(chat_id, limit=200)  # Увеличиваем лимит
-        result = []
-
-        for msg in messages:
-            if msg.text and search_date in msg.text and "тренировка" in msg.text.lower():
-                result.append({
-                    'chat_id': chat_id,
-                    'message_id': msg.message_id,
-                    'text': msg.text
-                })
-        return result
-    except Exception as e:
-        print(f"Ошибка поиска сообщений: {e}")
-        return []
-
-
-def is_training_message(msg, training_date):
-    """Проверяет что сообщение соответствует тренировке на указанную дату"""
-    if not msg.text:
-        return False
-
-    date_str = training_date.strftime('%d.%m.%Y')
-
-    # Проверяем что это сообщение о тренировке и содержит нужную дату
-    return ("тренировка" in msg.text.lower() and
-            date_str in msg.text and
-            any(word in msg.text.lower() for word in ["список", "игроки", "вратари"]))
-
-
-
 @bot.message_handler(commands=['canceltrain'])
 def start_cancel_training(message):
     if not is_admin(message.from_user.id):
@@ -939,33 +767,48 @@ def process_cancel_date(message):
             bot.reply_to(message, "⛔ Недостаточно прав!")
             return
 
-        date_str = message.text.strip()
-        training_date = datetime.strptime(date_str, '%d.%m.%Y').date()
+        training_date = datetime.strptime(message.text.strip(), '%d.%m.%Y').date()
+        # Ключи индекса - с ведущими нулями, а strptime принимает и "5.11.2026"
+        date_str = training_date.strftime('%d.%m.%Y')
         current_date = datetime.now().date()
 
         if training_date <= current_date:
             bot.reply_to(message, "❌ Можно отменять только будущие тренировки!")
             return
 
-        # 1. Удаляем сообщения из хранилища
-        messages_to_delete = training_messages_store.get(date_str, [])
-        success_count = 0
+        # 1. Закрываем составы: после этого нажатия кнопок отклоняются и
+        # не ставят отметки посещаемости в очередь после отмены
+        messages_to_delete = training_messages.messages_for(date_str)
+        removed = []
+        for chat_id, message_id in messages_to_delete:
+            with trainings.lock(chat_id, message_id):
+                removed.append((chat_id, message_id, trainings.remove(chat_id, message_id)))
+
+        # 2. Удаляем данные о посещаемости (таблица обновится фоном, после уже поставленных отметок)
+        if not sheets_outbox.submit_cancel(training_date):
+            # Отмена не записана - возвращаем составы, тренировка остается открытой
+            for chat_id, message_id, training in removed:
+                trainings.restore(chat_id, message_id, training)
+            bot.reply_to(message, "❌ Не удалось отменить тренировку в хранилище")
+            return
 
-        for msg_data in messages_to_delete:
+        # 3. Удаляем опубликованные сообщения тренировки (по индексу, без поиска).
+        # Из индекса убираем только удаленные - остальные можно будет найти снова
+        success_count = 0
+        for chat_id, message_id in messages_to_delete:
             try:
-                bot.delete_message(msg_data['chat_id'], msg_data['message_id'])
-                success_count += 1
+                bot.delete_message(chat_id, message_id)
             except Exception as e:
-                print(f"Не удалось удалить сообщение {msg_data['message_id']}: {e}")
-
-        # 2. Удаляем данные из таблицы
-        if gsheets.cancel_training(training_date):
-            result_msg = f"⛔️ Тренировка на {date_str} отменена!"
-            if success_count < len(messages_to_delete):
-                result_msg += f"\n(Удалено {success_count} из {len(messages_to_delete)} сообщений)"
-            bot.reply_to(message, result_msg)
-        else:
-            bot.reply_to(message, "❌ Не удалось отменить тренировку в таблице или на тренировку никто не записался")
+                print(f"Не удалось удалить сообщение {message_id}: {e}")
+                continue
+            success_count += 1
+            training_messages.remove_message(chat_id, message_id)
+            bot.edits.forget(chat_id, message_id)
+
+        result_msg = f"⛔️ Тренировка на {date_str} отменена!"
+        if success_count < len(messages_to_delete):
+            result_msg += f"\n(Удалено {success_count} из {len(messages_to_delete)} сообщений)"
+        bot.reply_to(message, result_msg)
 
     except ValueError as e:
         bot.reply_to(message, f"❌ Ошибка формата даты: {e}\nПожалуйста, введите дату в формате ДД.ММ.ГГГГ")
@@ -1072,6 +915,48 @@ def add_admin_command(message):
         bot.reply_to(message, f"❌ Ошибка: {str(e)}")
 
 
+# Команда для просмотра внутренних метрик бота (только для админов)
+@bot.message_handler(commands=['stats'])
+def show_stats(message):
+    if not is_admin(message.from_user.id):
+        bot.reply_to(message, "⛔ Недостаточно прав!")
+        return
+
+    outbound_stats = bot.outbound.stats()
+    edit_stats = bot.edits.stats()
+    lane_stats = update_lanes.stats()
+    users_stats = storage.users_stats()
+    response = (
+        "📈 Состояние бота:\n\n"
+        f"📤 Очередь отправки: {outbound_stats['queued']} (в работе: {outbound_stats['in_flight']})\n"
+        f"Отправлено: {outbound_stats['sent']}, повторов после 429: {outbound_stats['retried']}, "
+        f"ошибок: {outbound_stats['failed']}\n"
+        f"✏️ Правки составов: запрошено {edit_stats['requested']}, отправлено {edit_stats['sent']}, "
+        f"пропущено без изменений {edit_stats['skipped']}\n"
+        f"📝 Изменений таблицы в очереди на запись: {sheets_outbox.pending_count()}\n"
+        f"⏰ Отложенных задач: {scheduler.pending_count()}\n"
+        f"📥 Входящие апдейты: в очереди {lane_stats['queued']} "
+        f"(макс. в дорожке {lane_stats['max_backlog']}, дорожек {lane_stats['lanes']}), "
+        f"обработано {lane_stats['processed']}, нажатий без обработчика {callback_router.unhandled}\n"
+        f"🗂 Пользователей в памяти: {users_stats['users']}, ожидают записи {users_stats['pending']}, "
+        f"известных незарегистрированных {users_stats['unregistered']}"
+    )
+
+    # Ленивый клиент таблицы не подключаем ради статистики
+    if sheets is not None and getattr(sheets, 'connected', True):
+        quota_stats = sheets.quota.stats()
+        breaker_stats = sheets.breaker.stats()
+        response += (
+            f"\n📊 Google Sheets: осталось чтений {quota_stats['remaining']['read']}, "
+            f"записей {quota_stats['remaining']['write']}; выполнено чтений {quota_stats['read']}, "
+            f"записей {quota_stats['write']}, повторов {quota_stats['retried']}, ошибок {quota_stats['failed']}\n"
+            f"🔌 Предохранитель Sheets: {breaker_stats['state']}, размыканий {breaker_stats['opened']}, "
+            f"отклонено запросов {breaker_stats['rejected']}, медленных {breaker_stats['slow']}"
+            f"{' (пользователи из устаревшего снимка)' if storage.is_users_stale() else ''}"
+        )
+    bot.reply_to(message, response)
+
+
 # Команда для просмотра всех пользователей (только для админов)
 @bot.message_handler(commands=['users'])
 def list_users(message):
@@ -1080,7 +965,7 @@ def list_users(message):
         return
 
     try:
-        users = gsheets.worksheet.get_all_records()
+        users = storage.get_all_records()
         response = "📊 Зарегистрированные пользователи:\n\n"
         for user in users:
             admin_flag = " (admin)" if user.get('is_admin') == 'TRUE' else ""
@@ -1090,6 +975,29 @@ def list_users(message):
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
 
+# Inline-поиск игроков по началу ФИО (только для админов): @бот Ива
+@bot.inline_handler(func=lambda query: True)
+def search_players_inline(query):
+    try:
+        if not is_admin(query.from_user.id) or not query.query.strip():
+            bot.answer_inline_query(query.id, [], cache_time=60, is_personal=True)
+            return
+
+        # Ответ строится из зеркала пользователей, без запросов к таблице
+        results = [
+            types.InlineQueryResultArticle(
+                id=record['user_id'],
+                title=record['message'],
+                description=f"@{record['telegram_name']}" if record['telegram_name'] else record['full_name'],
+                input_message_content=types.InputTextMessageContent(record['message'])
+            )
+            for record in storage.search_users(query.query)
+        ]
+        bot.answer_inline_query(query.id, results, cache_time=5, is_personal=True)
+    except Exception as e:
+        print(f"Ошибка inline-поиска игроков: {e}")
+
+
 def remove_admin_from_config(admin_id):
     """
     Удаляет admin_id из массива ADMIN_IDS в config.py
@@ -1176,17 +1084,30 @@ def remove_admin_command(message):
         bot.reply_to(message, f"❌ Ошибка: {str(e)}")
 
 
+def delete_message_quietly(chat_id, message_id):
+    """Удаляет сообщение, игнорируя ошибки (например, уже удалено вручную)"""
+    try:
+        bot.delete_message(chat_id, message_id)
+    except Exception as e:
+        print(f"Не удалось удалить сообщение {message_id}: {e}")
+
+
+def delete_message_later(chat_id, message_id, delay=300):
+    """Удаляет сообщение в групповом чате через delay секунд (по умолчанию 5 минут)"""
+    scheduler.schedule(delay, 'delete_message', chat_id, message_id)
+
+
 @bot.message_handler(commands=['register'])
 def handle_register(message):
     try:
         user = message.from_user
 
         # Проверка регистрации
-        if gsheets.is_user_exists(user.id):
+        if storage.is_user_exists(user.id):
             reply = bot.reply_to(message, "⚠️ Вы уже зарегистрированы!")
             # Удаляем только в групповых чатах
             if message.chat.type != 'private':
-                threading.Timer(300, lambda: bot.delete_message(message.chat.id, reply.message_id)).start()
+                delete_message_later(message.chat.id, reply.message_id)
             return
 
         # Проверка типа чата
@@ -1204,7 +1125,7 @@ def handle_register(message):
                 reply_markup=markup
             )
             # Удаляем через 5 минут только в групповых чатах
-            threading.Timer(300, lambda: bot.delete_message(message.chat.id, sent_msg.message_id)).start()
+            delete_message_later(message.chat.id, sent_msg.message_id)
             return
 
         # Процесс регистрации в ЛС
@@ -1214,13 +1135,13 @@ def handle_register(message):
             reply_markup=types.ForceReply()
         )
         bot.register_next_step_handler(msg, lambda m: save_registration(m, user))
-        gsheets.clear_cache()
+        storage.forget_unregistered(user.id)
 
     except Exception as e:
         error_msg = bot.reply_to(message, f"❌ Ошибка: {e}")
         # Удаляем ошибку только в групповых чатах
         if message.chat.type != 'private':
-            threading.Timer(300, lambda: bot.delete_message(message.chat.id, error_msg.message_id)).start()
+            delete_message_later(message.chat.id, error_msg.message_id)
 
 
 def save_registration(message, user):
@@ -1230,30 +1151,38 @@ def save_registration(message, user):
             error_msg = bot.reply_to(message, "❌ Требуется ввести и Фамилию и Имя")
             # Сообщения в ЛС не удаляем
             if message.chat.type != 'private':
-                threading.Timer(300, lambda: bot.delete_message(message.chat.id, error_msg.message_id)).start()
+                delete_message_later(message.chat.id, error_msg.message_id)
             return
 
-        if gsheets.add_record(user, full_name):
+        # Регистрация действует сразу, в таблицу пишется фоном
+        if sheets_outbox.submit_registration(user, full_name):
             bot.reply_to(message, f"✅ Данные сохранены:\nИмя: {full_name}")
         else:
             error_msg = bot.reply_to(message, "❌ Ошибка при сохранении!")
             if message.chat.type != 'private':
-                threading.Timer(300, lambda: bot.delete_message(message.chat.id, error_msg.message_id)).start()
+                delete_message_later(message.chat.id, error_msg.message_id)
 
     except Exception as e:
         error_msg = bot.reply_to(message, f"❌ Ошибка: {e}")
         if message.chat.type != 'private':
-            threading.Timer(300, lambda: bot.delete_message(message.chat.id, error_msg.message_id)).start()
+            delete_message_later(message.chat.id, error_msg.message_id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('train_role_'))
+@callback_router.route('train_role_')
 def handle_training_button(call):
-    global training_date
     try:
         user = call.from_user
-        role = "Игрок" if call.data == 'train_role_player' else "Вратарь"
+        role = 'player' if call.data == 'train_role_player' else 'goalie'
 
         # Проверяем регистрацию
-        if not gsheets.is_user_exists(user.id):
+        if not storage.is_user_exists(user.id):
+            if storage.is_users_stale() and not storage.is_known_unregistered(user.id):
+                # Снимок устарел - пользователь мог зарегистрироваться после него
+                bot.answer_callback_query(
+                    call.id,
+                    "⏳ Таблица временно недоступна, не удалось проверить регистрацию. Попробуйте позже",
+                    show_alert=True
+                )
+                return
             bot.answer_callback_query(
                 call.id,
                 "⛔ Вы не зарегистрированы!\nИспользуйте /register",
@@ -1262,7 +1191,7 @@ def handle_training_button(call):
             return
 
         # Получаем данные из таблицы
-        user_data = gsheets.get_user_record(user.id)
+        user_data = storage.get_user_record(user.id)
         if not user_data or not user_data.get('message'):
             bot.answer_callback_query(
                 call.id,
@@ -1271,104 +1200,37 @@ def handle_training_button(call):
             )
             return
 
-        user_message = user_data['message']
-
-        # Разбираем текущее сообщение
-        lines = call.message.text.split('\n')
-        players = []
-        reserves = []
-        goalies = []
-        other_lines = []
-        current_section = None
-        player_limit = 0
-
-        # Парсим лимит игроков
-        for line in lines:
-            if "Лимит игроков:" in line:
-                try:
-                    player_limit = int(line.split(":")[1].strip())
-                except:
-                    player_limit = 0
-                break
-
-        # Обрабатываем все строки сообщения
-        for line in lines:
-            if "Игроки:" in line:
-                current_section = "players"
-                other_lines.append(line)
-            elif "Резерв:" in line:
-                current_section = "reserves"
-                other_lines.append(line)
-            elif "Вратари:" in line:
-                current_section = "goalies"
-                other_lines.append(line)
-            elif line.strip().startswith(('1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.')):
-                if current_section == "players":
-                    players.append(line)
-                elif current_section == "reserves":
-                    reserves.append(line)
-                elif current_section == "goalies":
-                    goalies.append(line)
-            else:
-                other_lines.append(line)
-
-        # Проверяем дублирование во всех списках
-        all_participants = players + reserves + goalies
-        if any(user_message in p for p in all_participants):
-            bot.answer_callback_query(call.id, f"⚠ Вы уже записаны на тренировку!")
-            return
-
-        # Обработка записи в зависимости от роли
-        if role == "Игрок":
-            if player_limit > 0 and len(players) >= player_limit:
-                # Записываем в резерв
-                new_number = len(reserves) + 1
-                reserves.append(f"{new_number}. {user_message} (резерв)")
-                response_text = "✅ Вы записаны в резерв!"
-            else:
-                # Записываем в основной состав
-                new_number = len(players) + 1
-                players.append(f"{new_number}. {user_message}")
-                response_text = "✅ Вы записаны как игрок!"
-        else:
-            # Для вратарей лимитов нет
-            new_number = len(goalies) + 1
-            goalies.append(f"{new_number}. {user_message}")
-            response_text = "✅ Вы записаны как вратарь!"
-
-        # Формируем новое сообщение
-        new_text = []
-        for line in other_lines:
-            if line == "Игроки:":
-                new_text.append(line)
-                new_text.extend(players)
-            elif line == "Резерв:":
-                new_text.append(line)
-                new_text.extend(reserves)
-            elif line == "Вратари:":
-                new_text.append(line)
-                new_text.extend(goalies)
-            else:
-                new_text.append(line)
-
-        # Обновляем сообщение
-        bot.edit_message_text(
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id,
-            text='\n'.join(new_text),
-            reply_markup=call.message.reply_markup
-        )
-
-        # Получаем дату тренировки из сообщения
-        for line in call.message.text.split('\n'):
-            if 'тренировка' in line.lower():
-                date_str = line.split('тренировка')[1].strip().split()[0]
-                training_date = datetime.strptime(date_str, '%d.%m.%Y')
-                break
+        # Все изменения состава тренировки выполняются последовательно
+        with trainings.lock(call.message.chat.id, call.message.message_id):
+            training = trainings.get_for_message(call.message)
+            if training is None:
+                bot.answer_callback_query(call.id, "❌ Тренировка уже перенесена или отменена", show_alert=True)
+                return
+
+            # Проверяем дублирование во всех списках
+            if training.is_member(user.id):
+                bot.answer_callback_query(call.id, f"⚠ Вы уже записаны на тренировку!")
+                return
+
+            # Записываем: вратарей без лимита, игроков сверх лимита - в резерв
+            section = training.add(user.id, user_data['message'], role)
+            trainings.save(training)
+            response_text = {
+                'players': "✅ Вы записаны как игрок!",
+                'reserves': "✅ Вы записаны в резерв!",
+                'goalies': "✅ Вы записаны как вратарь!",
+            }[section]
+
+            # Обновляем сообщение (правки схлопываются)
+            bot.queue_edit(
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=training.render(),
+                reply_markup=call.message.reply_markup
+            )
 
-        # Обновляем посещаемость
-        role_for_sheet = 'player' if call.data == 'train_role_player' else 'goalie'
-        gsheets.update_attendance(call.from_user.id, training_date, present=True)
+            # Обновляем посещаемость
+            sheets_outbox.submit_attendance(user.id, training.training_date, present=True, role=role)
 
         bot.answer_callback_query(call.id, response_text)
 
@@ -1473,12 +1335,14 @@ def unsubscribe_notifications(message):
 
 # Функция для отправки уведомлений
 def send_admin_notification(message_text):
-    """Отправляет уведомление всем подписанным админам"""
+    """Отправляет уведомление всем подписанным админам, не дожидаясь отправки"""
+    def report_error(admin_id, future):
+        if future.exception() is not None:
+            print(f"Не удалось отправить уведомление админу {admin_id}: {future.exception()}")
+
     for admin_id in NOTIFICATION_TO:
-        try:
-            bot.send_message(admin_id, message_text)
-        except Exception as e:
-            print(f"Не удалось отправить уведомление админу {admin_id}: {e}")
+        future = bot.queue_message(admin_id, message_text)
+        future.add_done_callback(lambda f, admin_id=admin_id: report_error(admin_id, f))
 
 @bot.message_handler(commands=['help'])
 def show_help(message):
@@ -1536,6 +1400,7 @@ def show_help(message):
 /removeadmin - Удалить администратора (ответом на сообщение)
 /admin - Проверить свои права
 /users - Просмотреть список зарегистрированных пользователей
+/stats - Показать очереди и метрики бота
 
 🕒 Форматы дат и времени
 Дата тренировки: ДД.ММ.ГГГГ (например: 15.12.2025)
@@ -1568,13 +1433,11 @@ https://github.com/Stabbar/ArmadaBookingBotAdmin/tree/master
 
 
 def cleanup_messages_store():
-    """Очищает хранилище от старых сообщений"""
-    global training_messages_store
-
+    """Забывает сообщения и составы прошедших тренировок"""
     current_date = datetime.now().date()
     old_dates = []
 
-    for date_str in training_messages_store:
+    for date_str in training_messages.dates():
         try:
             msg_date = datetime.strptime(date_str, '%d.%m.%Y').date()
             if msg_date < current_date:
@@ -1583,15 +1446,79 @@ def cleanup_messages_store():
             continue
 
     for date_str in old_dates:
-        del training_messages_store[date_str]
+        for chat_id, message_id in training_messages.remove_date(date_str):
+            trainings.remove(chat_id, message_id)
 
     # Повторяем каждые 24 часа
-    Timer(86400, cleanup_messages_store).start()
+    scheduler.call_later(86400, cleanup_messages_store)
+
+
+def refresh_users_mirror():
+    """Подтягивает новых пользователей из таблицы в локальное зеркало"""
+    storage.refresh_users()
+
+    # Повторяем по расписанию
+    scheduler.call_later(USERS_REFRESH_INTERVAL, refresh_users_mirror)
+
+
+def refresh_sheets_token():
+    """Обновляет токен Google заранее, чтобы запросы не ждали его обновления"""
+    # Ленивый клиент обновит токен сам при подключении
+    if sheets is not None and getattr(sheets, 'connected', True):
+        try:
+            sheets.refresh_token()
+        except Exception as e:
+            print(f"Ошибка обновления токена Google: {e}")
+
+    # Повторяем по расписанию
+    scheduler.call_later(TOKEN_REFRESH_INTERVAL, refresh_sheets_token)
+
 
+# Маршрутизаторы подключаются последними, после всех команд
+callback_router.install(bot)
+message_router.install(bot)
+
+# Обработчики отложенных задач, которые переживают перезапуск
+scheduler.register('delete_message', delete_message_quietly)
+scheduler.register('check_reserve_confirmation', check_reserve_confirmation)
+scheduler.start()
 
 # Запускаем очистку при старте
 cleanup_messages_store()
+scheduler.call_later(USERS_REFRESH_INTERVAL, refresh_users_mirror)
+scheduler.call_later(TOKEN_REFRESH_INTERVAL, refresh_sheets_token)
+
+# Журнал изменений отправляется в таблицу фоном, остаток - при остановке
+sheets_outbox.start()
+atexit.register(sheets_outbox.stop)
+
+def run_webhook():
+    """Получение апдейтов через webhook вместо long polling"""
+    path = getattr(config, 'WEBHOOK_PATH', WEBHOOK_PATH)
+    secret_token = getattr(config, 'WEBHOOK_SECRET', None)
+    server = WebhookServer(
+        update_lanes.dispatch,
+        host=getattr(config, 'WEBHOOK_LISTEN', WEBHOOK_LISTEN),
+        port=getattr(config, 'WEBHOOK_PORT', WEBHOOK_PORT),
+        path=path,
+        secret_token=secret_token
+    )
+
+    webhook_url = getattr(config, 'WEBHOOK_URL', None)
+    if webhook_url:
+        bot.set_webhook(url=webhook_url + path, allowed_updates=ALLOWED_UPDATES, secret_token=secret_token)
+    else:
+        # Локальный режим: апдейты присылает replay_updates.py
+        print("WEBHOOK_URL не задан - webhook в Telegram не регистрируется")
+
+    host, port = server.server_address[:2]
+    print(f"Бот запущен. Ожидание апдейтов на http://{host}:{port}{path}")
+    server.serve_forever()
+
 
 if __name__ == '__main__':
-    print("Бот запущен. Ожидание команд")
-    bot.infinity_polling(none_stop=True)
\ No newline at end of file
+    if '--webhook' in sys.argv:
+        run_webhook()
+    else:
+        print("Бот запущен. Ожидание команд")
+        bot.infinity_polling(none_stop=True, allowed_updates=ALLOWED_UPDATES)
\ No newline at end of file
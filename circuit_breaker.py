@@ -0,0 +1,97 @@
+import threading
+import time
+
+# Сколько неудачных или медленных вызовов подряд размыкают цепь
+FAILURE_THRESHOLD = 5
+# Вызов дольше этого (секунды) считается медленным
+SLOW_CALL_THRESHOLD = 5
+# Через сколько секунд после размыкания пропустить пробный вызов
+RESET_TIMEOUT = 30
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Вызов не выполнен: цепь разомкнута, сервис считается недоступным"""
+
+
+class CircuitBreaker:
+    """Предохранитель для внешнего сервиса.
+
+    Пока цепь замкнута, вызовы идут как обычно. После failure_threshold
+    ошибок или медленных вызовов подряд цепь размыкается, и вызовы сразу
+    получают CircuitOpenError, не дожидаясь таймаутов. Через reset_timeout
+    пропускается один пробный вызов: если он успешен, цепь замыкается,
+    если нет - снова размыкается.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, slow_call_threshold=SLOW_CALL_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {'opened': 0, 'rejected': 0, 'slow': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def is_open(self):
+        """True, если вызовы сейчас будут отклонены (без расхода пробного вызова)"""
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            if self._state == OPEN:
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self._probe_in_flight
+
+    def before_call(self):
+        """Разрешает вызов или бросает CircuitOpenError"""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._stats['rejected'] += 1
+        raise CircuitOpenError("Google Sheets временно недоступен")
+
+    def record_success(self, duration=0.0):
+        if duration >= self.slow_call_threshold:
+            with self._lock:
+                self._stats['slow'] += 1
+            self.record_failure()
+            return
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats['opened'] += 1
+                    print(f"Google Sheets не отвечает, цепь разомкнута на {self.reset_timeout} с")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self._state
+            stats['failures'] = self._failures
+        return stats
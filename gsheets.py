@@ -1,15 +1,40 @@
-import re
+import threading
 from datetime import datetime, timedelta
-import functools
 import gspread
+import requests
+from gspread.utils import rowcol_to_a1
 from oauth2client.service_account import ServiceAccountCredentials
 
+from attendance_matrix import AttendanceMatrix, TOTAL_HEADER, GOALIES_HEADER
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from sheets_quota import SheetsQuota, api_status
+from storage import Storage
 from config import SPREADSHEET_ID, WORKSHEET_NAME, ATTENDANCE_SHEET_NAME
 
 GOOGLE_SHEETS_CREDENTIALS_FILE = 'credentials.json'
 
-class GoogleSheetsClient:
+# Как часто дочитывать новые строки листа пользователей (секунды)
+USERS_REFRESH_INTERVAL = 60
+# Как часто перечитывать лист пользователей целиком
+USERS_FULL_RELOAD_INTERVAL = timedelta(minutes=30)
+# Зеркало старше этого считается устаревшим (таблица давно не отвечала)
+USERS_STALE_AFTER = timedelta(minutes=5)
+# Таймаут одного HTTP-запроса к Google Sheets (секунды)
+SHEETS_REQUEST_TIMEOUT = 10
+# Сколько keep-alive соединений держит общая HTTP-сессия (по числу параллельных потоков)
+HTTP_POOL_SIZE = 10
+# Токен обновляется заранее, если до истечения осталось меньше этого
+TOKEN_REFRESH_MARGIN = timedelta(minutes=10)
+# Как часто проверять срок действия токена (секунды)
+TOKEN_REFRESH_INTERVAL = 300
+# Как часто перечитывать лист посещаемости целиком, чтобы подхватить ручные правки
+ATTENDANCE_RELOAD_INTERVAL = timedelta(minutes=2)
+
+class GoogleSheetsClient(Storage):
+    """Хранилище в Google-таблице: лист пользователей и график посещений"""
+
     def __init__(self):
+        super().__init__()
         self.scope = [
             'https://spreadsheets.google.com/feeds',
             'https://www.googleapis.com/auth/drive'
@@ -17,38 +42,125 @@ class GoogleSheetsClient:
         self.creds = ServiceAccountCredentials.from_json_keyfile_name(
             GOOGLE_SHEETS_CREDENTIALS_FILE, self.scope)
         self.client = gspread.authorize(self.creds)
+        # Без таймаута зависший запрос держит поток бесконечно
+        if hasattr(self.client, 'set_timeout'):
+            self.client.set_timeout(SHEETS_REQUEST_TIMEOUT)
+        self._configure_session()
+        # Все запросы к API идут через учет квоты и предохранитель
+        self.breaker = CircuitBreaker()
+        self.quota = SheetsQuota(breaker=self.breaker)
         self._init_worksheet()
-        self._user_cache = {}
-        self._name_to_id_cache = {}
-        self._last_cache_update = datetime.min
-
-    def clear_cache(self):
-        """Очищает все кэши"""
-        self._user_cache = {}
-        self._name_to_id_cache = {}
-        self._last_cache_update = datetime.min
-        # Очищаем LRU кэши декорированных функций
-        self.get_user_record.cache_clear()
-        self.get_user_id_by_name.cache_clear()
-
-    def _check_cache_expiry(self):
-        """Проверяет истек ли срок действия кэша (5 минут)"""
-        if datetime.now() - self._last_cache_update > timedelta(minutes=1):
-            self.clear_cache()
+        self._users_row_count = 0
+        self._last_users_reload = datetime.min
+        self._users_synced_at = datetime.min
+        self._attendance_sheet = None
+        self._attendance = None
+        self._attendance_loaded_at = datetime.min
+        self._attendance_lock = threading.RLock()
+        self.reload_users()
+
+    def _http_client(self):
+        """Объект gspread, владеющий HTTP-сессией и учетными данными"""
+        # В gspread 6 сессия вынесена в client.http_client
+        return getattr(self.client, 'http_client', self.client)
+
+    def _configure_session(self):
+        """Настраивает общую keep-alive сессию на пул соединений для всех потоков.
+
+        Соединения с Google переиспользуются между запросами, а потоки,
+        которым не хватило соединения, ждут свободное вместо открытия нового.
+        """
+        session = getattr(self._http_client(), 'session', None)
+        if session is None:
+            return
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE,
+            pool_maxsize=HTTP_POOL_SIZE,
+            pool_block=True
+        )
+        session.mount('https://', adapter)
+
+    def refresh_token(self):
+        """Обновляет OAuth-токен заранее, пока старый еще действует.
+
+        Иначе токен обновляется прямо внутри запроса пользователя, когда
+        срок уже истек. Возвращает True, если токен был обновлен.
+        """
+        auth = getattr(self._http_client(), 'auth', None)
+        if hasattr(auth, 'expiry'):
+            # gspread 5+: учетные данные google-auth
+            if auth.expiry and auth.expiry - datetime.utcnow() > TOKEN_REFRESH_MARGIN:
+                return False
+            from google.auth.transport.requests import Request
+            auth.refresh(Request())
+            return True
+
+        # gspread 3: учетные данные oauth2client, заголовок сессии обновляет login()
+        expiry = self.creds.token_expiry
+        if expiry and expiry - datetime.utcnow() > TOKEN_REFRESH_MARGIN:
+            return False
+        import httplib2
+        self.creds.refresh(httplib2.Http())
+        self.client.login()
+        return True
+
+    def reload_users(self):
+        """Полностью перечитывает лист пользователей одним запросом"""
+        try:
+            rows = self.quota.read(self.worksheet.get_all_values)
+        except CircuitOpenError:
+            # Таблица недоступна - продолжаем отвечать из последнего снимка
+            return False
+        except Exception as e:
+            print(f"Ошибка загрузки листа пользователей: {e}")
+            return False
+
+        with self._users_lock:
+            # Первая строка - заголовки
+            self._load_user_rows(rows[1:])
+            self._users_row_count = max(len(rows), 1)
+            self._last_users_reload = self._users_synced_at = datetime.now()
+        return True
+
+    def refresh_users(self):
+        """Дочитывает только новые строки листа пользователей.
+
+        Раз в USERS_FULL_RELOAD_INTERVAL зеркало перечитывается целиком,
+        чтобы подхватить ручные правки и удаления в таблице.
+        """
+        if datetime.now() - self._last_users_reload > USERS_FULL_RELOAD_INTERVAL:
+            return self.reload_users()
+
+        try:
+            start_row = self._users_row_count + 1
+            rows = self.quota.read(self.worksheet.get, f"A{start_row}:F")
+        except CircuitOpenError:
+            return False
+        except Exception as e:
+            print(f"Ошибка обновления листа пользователей: {e}")
+            return False
+
+        with self._users_lock:
+            for row in rows:
+                self._index_user_row(row)
+            self._users_row_count = start_row - 1 + len(rows)
+            self._users_synced_at = datetime.now()
+        return True
 
     def _init_worksheet(self):
         """Инициализация листа с новыми полями"""
         try:
-            self.spreadsheet = self.client.open_by_key(SPREADSHEET_ID)
+            self.spreadsheet = self.quota.read(self.client.open_by_key, SPREADSHEET_ID)
             try:
-                self.worksheet = self.spreadsheet.worksheet(WORKSHEET_NAME)
+                self.worksheet = self.quota.read(self.spreadsheet.worksheet, WORKSHEET_NAME)
             except gspread.exceptions.WorksheetNotFound:
-                self.worksheet = self.spreadsheet.add_worksheet(
+                self.worksheet = self.quota.write_once(
+                    self.spreadsheet.add_worksheet,
                     title=WORKSHEET_NAME,
                     rows=50,
                     cols=10
                 )
-                self.worksheet.append_row([
+                self.quota.write_once(self.worksheet.append_row, [
                     "user_id",
                     "telegram_name",
                     "full_name",
@@ -63,281 +175,249 @@ class GoogleSheetsClient:
     def _update_headers(self, new_headers):
         """Обновление заголовков таблицы"""
         header_range = f"A1:{chr(65 + len(new_headers) - 1)}1"
-        self.worksheet.update(header_range, [new_headers])
+        self.quota.write(self.worksheet.update, header_range, [new_headers])
 
-    @staticmethod
-    def get_full_name(user):
-        """Объединяет имя и фамилию пользователя"""
-        first_name = user.first_name or ""
-        last_name = user.last_name or ""
-        return f"{first_name} {last_name}".strip()
+    def get_all_records(self):
+        """Все записи листа пользователей со всеми колонками"""
+        return self.quota.read(self.worksheet.get_all_records)
 
-    def is_user_exists(self, user_id):
-        """Проверяет существование пользователя по ID"""
-        try:
-            # Ищем в первом столбце (user_id)
-            cell = self.worksheet.find(str(user_id), in_column=1)
-            return cell
-        except Exception as e:
-            print(f"Ошибка при проверке пользователя: {e}")
-            return False
+    def is_users_stale(self):
+        """True, если зеркало пользователей отдается из старого снимка"""
+        return self.breaker.is_open() or datetime.now() - self._users_synced_at > USERS_STALE_AFTER
+
+    def append_user_rows(self, rows):
+        """Дописывает строки пользователей, которых еще нет на листе.
 
-    def add_record(self, user, message_text):
-        """Добавляет запись в таблицу"""
+        Перед записью читается столбец user_id, поэтому повторная отправка
+        той же регистрации не создает дубликат строки.
+        """
         try:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            row = [
-                user.id,
-                user.username or "",
-                self.get_full_name(user),
-                message_text,
-                timestamp
-            ]
-            self.worksheet.append_row(row)
+            existing = set(self.quota.read(self.worksheet.col_values, 1))
+            new_rows = []
+            skipped_ids = []
+            for row in rows:
+                if str(row[0]) not in existing:
+                    existing.add(str(row[0]))
+                    new_rows.append(row)
+                else:
+                    skipped_ids.append(row[0])
+
+            if new_rows:
+                self.quota.write_once(self.worksheet.append_rows, new_rows)
+
+            with self._users_lock:
+                self._users_row_count += len(new_rows)
+                if skipped_ids:
+                    # В зеркале могли остаться присланные, а не записанные данные -
+                    # при следующем обновлении лист перечитается целиком
+                    self._last_users_reload = datetime.min
+            self._users_written(new_rows, skipped_ids)
             return True
         except Exception as e:
             print(f"Ошибка при добавлении записи: {e}")
             return False
 
-    @functools.lru_cache(maxsize=1000)  # Дополнительное кэширование на уровне функции
-    def get_user_record(self, user_id):
-        """Возвращает запись пользователя по ID с кэшированием"""
-        try:
-            self._check_cache_expiry()
-
-            # Проверяем кэш
-            if str(user_id) in self._user_cache:
-                return self._user_cache[str(user_id)]
-
-            # Если нет в кэше, ищем в таблице
-            cell = self.worksheet.find(str(user_id))
-            if cell:
-                record = {
-                    'user_id': self.worksheet.cell(cell.row, 1).value,
-                    'telegram_name': self.worksheet.cell(cell.row, 2).value,
-                    'full_name': self.worksheet.cell(cell.row, 3).value,
-                    'message': self.worksheet.cell(cell.row, 4).value
-                }
-
-                # Сохраняем в кэш
-                self._user_cache[str(user_id)] = record
-                self._last_cache_update = datetime.now()
-                return record
-
-            return None
-        except Exception as e:
-            print(f"Ошибка при поиске пользователя: {e}")
-            return None
-
-    def invalidate_user_cache(self, user_id=None):
-        """Инвалидирует кэш для конкретного пользователя или полностью"""
-        if user_id is None:
-            self.clear_cache()
-        else:
-            self._user_cache.pop(str(user_id), None)
-            self.get_user_record.cache_clear()  # Очищаем LRU кэш
-
-    @functools.lru_cache(maxsize=1000)
-    def get_user_id_by_name(self, message):
-        """Возвращает user_id по ФИО пользователя с кэшированием"""
-        try:
-            self._check_cache_expiry()
-
-            # Проверяем кэш
-            if message in self._name_to_id_cache:
-                return self._name_to_id_cache[message]
-
-            # Если нет в кэше, ищем в таблице
-            cell = self.worksheet.find(message)
-            if cell:
-                # Предполагаем, что ФИО находится в 3 колонке (как в get_user_record)
-                if cell.col != 4:
-                    # Если нашли не в той колонке, ищем правильно
-                    for row in self.worksheet.get_all_values():
-                        if len(row) > 3 and row[3] == message:
-                            user_id = row[0] if len(row) > 0 else None
-                            if user_id:
-                                # Сохраняем в кэш
-                                self._name_to_id_cache[message] = user_id
-                                self._last_cache_update = datetime.now()
-                                return user_id
-                    return None
-
-                # Если нашли в правильной колонке
-                user_id = self.worksheet.cell(cell.row, 1).value  # 1 колонка - user_id
-                if user_id:
-                    # Сохраняем в кэш
-                    self._name_to_id_cache[message] = user_id
-                    self._last_cache_update = datetime.now()
-                    return user_id
-
-            return None
-        except Exception as e:
-            print(f"Ошибка при поиске user_id по ФИО: {e}")
-            return None
-
-    @functools.lru_cache(maxsize=1000)
-    def find_user_by_name(self, name):
-        """Ищет пользователя по ФИО с очисткой строки и кэшированием"""
-        try:
-            # Очищаем имя от лишних символов и нумерации
-            clean_name = re.sub(r'^\d+\.?\s*', '', name)  # Удаляем нумерацию (1., 2 и т.д.)
-            clean_name = re.sub(r'[^a-zA-Zа-яА-ЯёЁ\s]', '', clean_name).strip()
-
-            if not clean_name:
-                return None
-
-            # Используем существующую логику поиска
-            user_id = self.get_user_id_by_name(clean_name)
-
-            if user_id:
-                return {
-                    'user_id': user_id,
-                    'full_name': clean_name
-                }
-            return None
-
-        except Exception as e:
-            print(f"Ошибка поиска пользователя по имени: {e}")
-            return None
-
     def get_attendance_sheet(self):
-        """Возвращает лист с графиком посещений, создает если не существует"""
+        """Возвращает лист с графиком посещений, создает если не существует.
+
+        Лист ищется один раз за время работы, дальше используется сохраненный
+        объект листа без лишних запросов метаданных таблицы.
+        """
+        if self._attendance_sheet is not None:
+            return self._attendance_sheet
         try:
-            spreadsheet = self.client.open_by_key(SPREADSHEET_ID)
             try:
-                worksheet = spreadsheet.worksheet(ATTENDANCE_SHEET_NAME)
+                worksheet = self.quota.read(self.spreadsheet.worksheet, ATTENDANCE_SHEET_NAME)
             except gspread.exceptions.WorksheetNotFound:
-                worksheet = spreadsheet.add_worksheet(
+                worksheet = self.quota.write_once(
+                    self.spreadsheet.add_worksheet,
                     title=ATTENDANCE_SHEET_NAME,
                     rows=100,
                     cols=20
                 )
                 # Создаем заголовки
-                worksheet.update('A1:B1', [['ФИО', 'Всего']])
+                self.quota.write(worksheet.update, 'A1:B1', [['ФИО', 'Всего']])
+            self._attendance_sheet = worksheet
             return worksheet
         except Exception as e:
             print(f"Ошибка доступа к таблице посещений: {e}")
             raise
 
-    def update_attendance(self, user_id, training_date, present=True, role=None):
-        """Обновляет график посещений с учетом роли (player/goalie)"""
-        try:
-            # Открываем таблицу посещений
-            worksheet = self.get_attendance_sheet()
-            # Получаем данные
-            records = worksheet.get_all_records()
-            headers = worksheet.row_values(1)
-            date_str = training_date.strftime('%d.%m.%Y')
-
-            # Проверяем/добавляем столбец с датой
-            if date_str not in headers:
-                worksheet.insert_cols([[date_str]], len(headers))
-                headers = worksheet.row_values(1)
-
-            # Ищем пользователя
-            user_data = self.get_user_record(user_id)
-            if not user_data:
+    def _get_attendance_matrix(self, worksheet, fresh=False):
+        """Возвращает локальную копию листа посещаемости.
+
+        Копия перечитывается раз в ATTENDANCE_RELOAD_INTERVAL: админ может
+        сортировать или править лист вручную, и запись по старым номерам
+        строк и столбцов попала бы не в те ячейки. fresh=True - перечитать
+        сразу (перед удалением столбца).
+        """
+        if (fresh or self._attendance is None
+                or datetime.now() - self._attendance_loaded_at > ATTENDANCE_RELOAD_INTERVAL):
+            self._attendance = AttendanceMatrix(self.quota.read(worksheet.get_all_values))
+            self._attendance_loaded_at = datetime.now()
+        return self._attendance
+
+    def _attendance_failed(self, error):
+        """Сбрасывает локальные данные листа посещаемости после ошибки записи"""
+        # Локальная копия могла разойтись с таблицей - перечитаем при следующем обращении
+        self._attendance = None
+        # Лист удалили или переименовали - найдем (или создадим) его заново
+        if isinstance(error, gspread.exceptions.WorksheetNotFound) or api_status(error) in (400, 404):
+            self._attendance_sheet = None
+
+    def update_attendance_batch(self, changes):
+        """Применяет пачку изменений посещаемости.
+
+        changes - список кортежей (user_id, training_date, present, role).
+        Изменения вносятся в локальную копию листа, а в таблицу уходят только
+        затронутые ячейки и итоги одним batch_update.
+        """
+        with self._attendance_lock:
+            try:
+                worksheet = self.get_attendance_sheet()
+                matrix = self._get_attendance_matrix(worksheet)
+                headers_changed = matrix.ensure_totals()
+
+                # Добавляем недостающие столбцы с датами перед "Всего"
+                for date_str in sorted({d.strftime('%d.%m.%Y') for _, d, _, _ in changes}):
+                    col_idx, created = matrix.ensure_column(date_str)
+                    if created:
+                        self.quota.write_once(worksheet.insert_cols, [[date_str]], col_idx + 1)
+
+                new_rows = []
+                touched = {}
+
+                for user_id, training_date, present, role in changes:
+                    user_data = self.get_user_record(user_id)
+                    if not user_data or not user_data.get('message'):
+                        continue
+
+                    user_name = user_data['message']
+                    if not present and user_name not in matrix.row_by_name:
+                        continue
+
+                    row_idx, created = matrix.ensure_row(user_name)
+                    if created:
+                        new_rows.append(row_idx)
+
+                    col_idx = matrix.col_by_header[training_date.strftime('%d.%m.%Y')]
+                    if matrix.set_value(row_idx, col_idx, self._attendance_value(present, role)):
+                        touched.setdefault(row_idx, set()).add(col_idx)
+
+                batch = []
+                if headers_changed:
+                    batch.append({
+                        'range': f"A1:{rowcol_to_a1(1, len(matrix.headers))}",
+                        'values': [matrix.headers]
+                    })
+
+                total_col = matrix.total_col
+                for row_idx, columns in touched.items():
+                    totals = list(matrix.recount(row_idx))
+                    if row_idx in new_rows:
+                        continue
+                    for col_idx in columns:
+                        batch.append({
+                            'range': rowcol_to_a1(row_idx + 1, col_idx + 1),
+                            'values': [[matrix.get_value(row_idx, col_idx)]]
+                        })
+                    batch.append({
+                        'range': f"{rowcol_to_a1(row_idx + 1, total_col + 1)}:{rowcol_to_a1(row_idx + 1, total_col + 2)}",
+                        'values': [totals]
+                    })
+
+                if new_rows:
+                    self.quota.write_once(worksheet.append_rows, [matrix.rows[i] for i in new_rows],
+                                          value_input_option='USER_ENTERED')
+                if batch:
+                    self.quota.write(worksheet.batch_update, batch, value_input_option='USER_ENTERED')
+                return True
+
+            except Exception as e:
+                print(f"Ошибка обновления посещаемости: {e}")
+                self._attendance_failed(e)
                 return False
 
-            user_name = user_data['message']
-            user_row = None
-
-            for i, row in enumerate(worksheet.get_all_values(), 1):
-                if row and row[0] == user_name:
-                    user_row = i
-                    break
-
-            # Если пользователь не найден - добавляем
-            if not user_row:
-                new_row = [user_name] + ['' for _ in range(len(headers) - 1)]
-                worksheet.append_row(new_row)
-                user_row = len(worksheet.get_all_values())
-
-            # Обновляем ячейку с учетом роли
-            col_idx = headers.index(date_str) + 1
-            current_value = worksheet.cell(user_row, col_idx).value
-
-            # Формируем новое значение
-            if not present:
-                new_value = ''
-            elif role == 'goalie':
-                new_value = 'G'  # Отметка для вратарей
-            else:
-                new_value = '1'  # Обычное посещение
-
-            # Обновляем только если:
-            # - Нет текущей записи и нужно поставить посещение
-            # - Или нужно убрать посещение
-            if (not current_value and present) or (current_value and not present):
-                worksheet.update_cell(user_row, col_idx, new_value)
-
-            # Обновляем "Всего" и "Вратари"
-            total_col = len(headers)
-            if "Всего" not in headers[-1]:
-                worksheet.update_cell(1, total_col, "Всего")
-                worksheet.update_cell(1, total_col + 1, "Вратари")
-
-            # Считаем статистику
-            row_values = worksheet.row_values(user_row)
-            total_visits = sum(1 for val in row_values[1:-2] if val == '1')
-            goalie_visits = sum(1 for val in row_values[1:-2] if val == 'G')
-
-            worksheet.update_cell(user_row, total_col, total_visits)
-            worksheet.update_cell(user_row, total_col + 1, goalie_visits)
+    def cancel_training(self, training_date):
+        """Удаляет данные о тренировке из таблицы.
 
-            return True
+        True - столбец удален, None - такой тренировки в таблице нет,
+        False - ошибка записи.
+        """
+        with self._attendance_lock:
+            try:
+                worksheet = self.get_attendance_sheet()
+                # Столбец удаляется по номеру - номер берем из свежей копии листа
+                matrix = self._get_attendance_matrix(worksheet, fresh=True)
+                date_str = training_date.strftime('%d.%m.%Y')
 
-        except Exception as e:
-            print(f"Ошибка обновления посещаемости: {e}")
-            return False
+                if date_str not in matrix.col_by_header:
+                    return None  # Нет такой тренировки
 
-#TODO: Подсчет тренировок слетает при отмене. Минорно, но потом надо будет поправить
-    def cancel_training(self, training_date):
-        """Удаляет данные о тренировке из таблицы"""
-        try:
-            worksheet = self.get_attendance_sheet()
-            headers = worksheet.row_values(1)
-            date_str = training_date.strftime('%d.%m.%Y')
+                # Находим индекс столбца
+                col_idx = matrix.col_by_header[date_str]
 
-            if date_str not in headers:
-                return False  # Нет такой тренировки
+                # Удаляем столбец со сдвигом влево
+                self.quota.write_once(worksheet.delete_columns, col_idx + 1)  # +1 т.к. индексы в таблице с 1
+                matrix.delete_column(col_idx)
 
-            # Находим индекс столбца
-            col_idx = headers.index(date_str) + 1  # +1 т.к. индексы с 1
+                # Обновляем "Всего" для всех пользователей
+                self.recalculate_totals(worksheet)
 
-            # Удаляем столбец со сдвигом влево
-            worksheet.delete_columns(col_idx)
+                return True
 
-            # Обновляем "Всего" для всех пользователей
-            self.recalculate_totals(worksheet)
+            except Exception as e:
+                print(f"Ошибка отмены тренировки: {e}")
+                self._attendance_failed(e)
+                return False
 
-            return True
+    def recalculate_totals(self, worksheet):
+        """Пересчитывает графы 'Всего' и 'Вратари' и записывает их одним запросом"""
+        with self._attendance_lock:
+            try:
+                matrix = self._get_attendance_matrix(worksheet)
 
-        except Exception as e:
-            print(f"Ошибка отмены тренировки: {e}")
-            return False
+                if TOTAL_HEADER not in matrix.col_by_header:
+                    return
 
+                matrix.ensure_totals()
+                total_col = matrix.total_col
 
-    def recalculate_totals(self, worksheet):
-        """Пересчитывает графу 'Всего'"""
-        try:
-            records = worksheet.get_all_records()
-            headers = worksheet.row_values(1)
+                # Первая строка диапазона - заголовки, дальше итоги по каждому игроку
+                values = [[TOTAL_HEADER, GOALIES_HEADER]]
+                for row_idx in range(1, len(matrix.rows)):
+                    if matrix.rows[row_idx][0]:
+                        values.append(list(matrix.recount(row_idx)))
+                    else:
+                        values.append(['', ''])
 
-            if 'Всего' not in headers:
-                return
+                totals_range = f"{rowcol_to_a1(1, total_col + 1)}:{rowcol_to_a1(len(values), total_col + 2)}"
+                self.quota.write(worksheet.update, totals_range, values, value_input_option='USER_ENTERED')
 
-            total_col = headers.index('Всего') + 1
-            all_values = worksheet.get_all_values()
+            except Exception as e:
+                print(f"Ошибка пересчета итогов: {e}")
+                self._attendance_failed(e)
 
-            for i, row in enumerate(all_values[1:], start=2):  # Пропускаем заголовок
-                if not row:
-                    continue
 
-                # Считаем отметки посещения (✅)
-                visits = sum(1 for val in row[1:total_col - 1] if val == '✅')
-                worksheet.update_cell(i, total_col, visits)
+class LazySheetsClient:
+    """GoogleSheetsClient, который подключается к таблице при первом обращении.
 
-        except Exception as e:
-            print(f"Ошибка пересчета итогов: {e}")
\ No newline at end of file
+    Позволяет запускать бота без credentials.json и сети, если таблица
+    нужна только как отчет, заполняемый фоном. Если подключиться не
+    удалось, попытка повторится при следующем обращении.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self):
+        return self._client is not None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = GoogleSheetsClient()
+        return getattr(self._client, name)
@@ -0,0 +1,83 @@
+import queue
+import threading
+
+# Количество дорожек (потоков) обработки апдейтов
+UPDATE_LANES = 8
+# Сколько апдейтов может ждать в одной дорожке, дальше polling притормаживает
+UPDATE_LANE_BACKLOG = 1000
+
+
+def update_lane_key(update):
+    """Ключ упорядочивания апдейта: пользователь, а для событий без него - чат"""
+    for field in ('message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result'):
+        event = getattr(update, field, None)
+        if event is None:
+            continue
+        user = getattr(event, 'from_user', None)
+        if user is not None:
+            return user.id
+        chat = getattr(event, 'chat', None)
+        if chat is not None:
+            return chat.id
+    return update.update_id
+
+
+class LanePool:
+    """Ограниченный пул обработки апдейтов с упорядоченными дорожками.
+
+    Апдейты раскладываются по дорожкам по хэшу пользователя (или чата),
+    поэтому разные пользователи обрабатываются параллельно, а сообщения
+    одного пользователя (в том числе шаги register_next_step_handler) -
+    строго по очереди.
+    """
+
+    def __init__(self, lanes=UPDATE_LANES, max_backlog=UPDATE_LANE_BACKLOG):
+        self._process = None
+        self._queues = [queue.Queue(maxsize=max_backlog) for _ in range(lanes)]
+        self._processed = [0] * lanes
+        self._threads = [
+            threading.Thread(target=self._run, args=(i,), name=f'update-lane-{i}', daemon=True)
+            for i in range(lanes)
+        ]
+
+    def install(self, bot):
+        """Подключает пул к боту: все апдейты (polling и webhook) идут по дорожкам.
+
+        Бот должен быть создан с threaded=False, чтобы обработчики выполнялись
+        прямо в потоке дорожки.
+        """
+        self._process = bot.process_new_updates
+        bot.process_new_updates = self.dispatch
+        for thread in self._threads:
+            thread.start()
+
+    def dispatch(self, updates):
+        """Раскладывает апдейты по дорожкам"""
+        for update in updates:
+            lane = hash(update_lane_key(update)) % len(self._queues)
+            self._queues[lane].put(update)
+
+    def backlog(self):
+        """Количество ожидающих апдейтов по каждой дорожке"""
+        return [lane_queue.qsize() for lane_queue in self._queues]
+
+    def stats(self):
+        backlog = self.backlog()
+        return {
+            'lanes': len(backlog),
+            'queued': sum(backlog),
+            'max_backlog': max(backlog),
+            'processed': sum(self._processed),
+        }
+
+    def _run(self, lane):
+        lane_queue = self._queues[lane]
+        while True:
+            update = lane_queue.get()
+            try:
+                self._process([update])
+            except Exception as e:
+                print(f"Ошибка обработки апдейта {update.update_id}: {e}")
+            finally:
+                self._processed[lane] += 1
+                lane_queue.task_done()
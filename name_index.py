@@ -0,0 +1,172 @@
+import re
+from collections import Counter
+
+# Минимальная похожесть (коэффициент Дайса по триграммам) для подсказки
+SIMILARITY_THRESHOLD = 0.5
+# Сколько подсказок возвращать
+MAX_SUGGESTIONS = 3
+# Сколько вариантов автодополнения возвращать
+MAX_COMPLETIONS = 20
+
+
+def normalize_name(name):
+    """Ключ ФИО для поиска: без регистра, ё как е, слова в алфавитном порядке.
+
+    "Иванов Иван", "иван  ИВАНОВ" и "Иванов Иван." дают один и тот же ключ.
+    """
+    words = re.findall(r'[^\W\d_]+', str(name).casefold().replace('ё', 'е'))
+    return ' '.join(sorted(words))
+
+
+def prefix_key(text):
+    """Строка для поиска по префиксу: без регистра, ё как е, порядок слов сохраняется"""
+    return ' '.join(re.findall(r'[^\W\d_]+', str(text).casefold().replace('ё', 'е')))
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Индекс ФИО пользователей: точный поиск по ключу и похожие по триграммам.
+
+    Одно ФИО может принадлежать нескольким пользователям (тезки), поэтому
+    по ключу хранятся все их user_id. Не потокобезопасен сам по себе -
+    вызывающий держит блокировку зеркала.
+    """
+
+    def __init__(self):
+        # ключ -> {user_id: ФИО как его ввел пользователь}
+        self._by_key = {}
+        self._trigrams = {}
+        self._sizes = {}
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def add(self, name, user_id):
+        key = normalize_name(name)
+        if not key:
+            return
+        if key not in self._by_key:
+            grams = trigrams(key)
+            self._sizes[key] = len(grams)
+            for gram in grams:
+                self._trigrams.setdefault(gram, set()).add(key)
+            self._by_key[key] = {}
+        self._by_key[key][user_id] = name
+
+    def remove(self, name, user_id):
+        """Удаляет ФИО этого пользователя; тезки остаются в индексе"""
+        key = normalize_name(name)
+        users = self._by_key.get(key)
+        if users is None or users.pop(user_id, None) is None or users:
+            return
+        del self._by_key[key]
+        del self._sizes[key]
+        for gram in trigrams(key):
+            keys = self._trigrams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._trigrams[gram]
+
+    def lookup(self, name):
+        """Все user_id с этим ФИО (без учета регистра, ё/е и порядка слов)"""
+        return list(self._by_key.get(normalize_name(name), ()))
+
+    def get(self, name):
+        """user_id по ФИО или None, если такого ФИО нет или оно у нескольких пользователей"""
+        users = self._by_key.get(normalize_name(name))
+        if not users or len(users) > 1:
+            return None
+        return next(iter(users))
+
+    def similar(self, name, limit=MAX_SUGGESTIONS, threshold=SIMILARITY_THRESHOLD):
+        """Похожие ФИО: список (ФИО, user_id, похожесть) по убыванию похожести"""
+        key = normalize_name(name)
+        if not key:
+            return []
+        grams = trigrams(key)
+        common = Counter()
+        for gram in grams:
+            common.update(self._trigrams.get(gram, ()))
+
+        result = []
+        for candidate, shared in common.items():
+            score = 2 * shared / (len(grams) + self._sizes[candidate])
+            if score >= threshold:
+                for user_id, display_name in self._by_key[candidate].items():
+                    result.append((display_name, user_id, score))
+        result.sort(key=lambda item: item[2], reverse=True)
+        return result[:limit]
+
+
+class _TrieNode:
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        self.values = set()
+
+
+class PrefixTrie:
+    """Префиксное дерево ФИО для автодополнения.
+
+    Каждое ФИО добавляется с начала каждого слова, поэтому "Ива" находит
+    и "Иванов Петр", и "Петров Иван". Не потокобезопасно само по себе -
+    вызывающий держит блокировку зеркала.
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+
+    @staticmethod
+    def _suffixes(name):
+        words = prefix_key(name).split(' ')
+        return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+    def add(self, name, value):
+        for suffix in self._suffixes(name):
+            node = self._root
+            for char in suffix:
+                node = node.children.setdefault(char, _TrieNode())
+            node.values.add(value)
+
+    def remove(self, name, value):
+        for suffix in self._suffixes(name):
+            path = [self._root]
+            for char in suffix:
+                node = path[-1].children.get(char)
+                if node is None:
+                    break
+                path.append(node)
+            else:
+                path[-1].values.discard(value)
+                # Убираем опустевшие ветки
+                for i in range(len(suffix), 0, -1):
+                    node = path[i]
+                    if node.values or node.children:
+                        break
+                    del path[i - 1].children[suffix[i - 1]]
+
+    def search(self, prefix, limit=MAX_COMPLETIONS):
+        """Значения, у которых ФИО (или одно из его слов) начинается с prefix"""
+        node = self._root
+        for char in prefix_key(prefix):
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        found = []
+        seen = set()
+        stack = [node]
+        while stack and len(found) < limit:
+            node = stack.pop()
+            for value in node.values:
+                if value not in seen:
+                    seen.add(value)
+                    found.append(value)
+            stack.extend(node.children.values())
+        return found[:limit]
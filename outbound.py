@@ -0,0 +1,319 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import telebot
+from telebot.apihelper import ApiTelegramException
+
+from ratelimit import TokenBucket
+
+# Лимиты Telegram Bot API
+GLOBAL_RATE = 30          # сообщений в секунду на бота
+PRIVATE_CHAT_RATE = 1     # сообщение в секунду в личный чат
+GROUP_CHAT_RATE = 20 / 60  # 20 сообщений в минуту в группу
+SENDER_THREADS = 4
+# Окно, в котором правки одного сообщения схлопываются в одну (секунды)
+EDIT_COALESCE_WINDOW = 0.3
+
+# Приоритеты: ответы на кнопки важнее новых сообщений, а те - правок
+PRIORITY_CALLBACK = 0
+PRIORITY_SEND = 1
+PRIORITY_EDIT = 2
+PRIORITIES = (PRIORITY_CALLBACK, PRIORITY_SEND, PRIORITY_EDIT)
+
+
+def _chat_key(chat_id):
+    """Приводит id чата к одному виду: '123' и 123 - один и тот же чат"""
+    try:
+        return int(chat_id)
+    except (TypeError, ValueError):
+        return chat_id
+
+
+class _Job:
+    __slots__ = ('priority', 'chat_id', 'func', 'args', 'kwargs', 'future')
+
+    def __init__(self, priority, chat_id, func, args, kwargs):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class OutboundDispatcher:
+    """Очередь исходящих запросов к Telegram.
+
+    Соблюдает общий лимит бота и лимиты отдельных чатов (ведра токенов),
+    выполняет запросы по приоритетам, при 429 ждет retry_after и повторяет
+    запрос, а не теряет его. Запросы в один чат выполняются строго по очереди.
+    """
+
+    def __init__(self, threads=SENDER_THREADS, global_rate=GLOBAL_RATE,
+                 private_rate=PRIVATE_CHAT_RATE, group_rate=GROUP_CHAT_RATE):
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._busy_chats = set()
+        self._condition = threading.Condition()
+        self._stats = {'sent': 0, 'retried': 0, 'failed': 0}
+        self._threads = [
+            threading.Thread(target=self._run, name=f'outbound-{i}', daemon=True)
+            for i in range(threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, priority, chat_id, func, *args, **kwargs):
+        """Ставит запрос в очередь и возвращает Future с его результатом"""
+        job = _Job(priority, _chat_key(chat_id), func, args, kwargs)
+        with self._condition:
+            self._queues[priority].append(job)
+            self._condition.notify()
+        return job.future
+
+    def call(self, priority, chat_id, func, *args, **kwargs):
+        """Выполняет запрос через очередь и ждет результата"""
+        return self.submit(priority, chat_id, func, *args, **kwargs).result()
+
+    def stats(self):
+        """Метрики очереди"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats['queued'] = sum(len(queue) for queue in self._queues.values())
+            stats['in_flight'] = len(self._busy_chats)
+        return stats
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id и @username - группы и каналы
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate = self.private_rate if is_private else self.group_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, capacity=1)
+            if len(self._chat_buckets) > 1000:
+                self._prune_buckets()
+        return bucket
+
+    def _prune_buckets(self):
+        for chat_id in [c for c, b in self._chat_buckets.items() if b.is_full() and c not in self._busy_chats]:
+            del self._chat_buckets[chat_id]
+
+    def _next_job(self):
+        """Выбирает готовый к отправке запрос. Возвращает (job, сколько ждать)"""
+        # Общий лимит расходуется только здесь и под блокировкой очереди
+        if self._global_bucket.available() < 1:
+            return None, 1 / self._global_bucket.rate
+
+        wait = None
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            for job in list(queue):
+                if job.chat_id is not None:
+                    if job.chat_id in self._busy_chats:
+                        continue
+                    chat_wait = self._chat_bucket(job.chat_id).try_acquire()
+                    if chat_wait:
+                        wait = chat_wait if wait is None else min(wait, chat_wait)
+                        continue
+
+                self._global_bucket.try_acquire()
+                queue.remove(job)
+                if job.chat_id is not None:
+                    self._busy_chats.add(job.chat_id)
+                return job, None
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._condition:
+                job, wait = self._next_job()
+                while job is None:
+                    self._condition.wait(wait)
+                    job, wait = self._next_job()
+
+            requeue = False
+            try:
+                result = job.func(*job.args, **job.kwargs)
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                    bucket = self._chat_bucket(job.chat_id) if job.chat_id is not None else self._global_bucket
+                    bucket.pause(retry_after)
+                    requeue = True
+                else:
+                    job.future.set_exception(e)
+            except Exception as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+
+            with self._condition:
+                self._busy_chats.discard(job.chat_id)
+                if requeue:
+                    self._stats['retried'] += 1
+                    self._queues[job.priority].appendleft(job)
+                elif job.future.exception() is not None:
+                    self._stats['failed'] += 1
+                else:
+                    self._stats['sent'] += 1
+                self._condition.notify_all()
+
+
+def _timer_call_later(delay, func, *args):
+    timer = threading.Timer(delay, func, args)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+class EditCoalescer:
+    """Схлопывает частые правки одного сообщения.
+
+    Правки копятся по ключу (chat_id, message_id) в течение короткого окна.
+    В очереди отправки на каждое сообщение стоит не больше одной правки, и
+    текст она берет в момент отправки - самый последний, сколько бы правок
+    ни пришло, пока она ждала лимита чата. Если текст совпадает с уже
+    отправленным, правка пропускается (и Telegram не отвечает
+    "message is not modified").
+    """
+
+    def __init__(self, outbound, edit_func, window=EDIT_COALESCE_WINDOW, max_tracked=1000, call_later=None):
+        self.outbound = outbound
+        self.edit_func = edit_func
+        # call_later(delay, func, *args) - планировщик отложенных вызовов
+        self.call_later = call_later or _timer_call_later
+        self.window = window
+        self.max_tracked = max_tracked
+        # Последний запрошенный, но еще не отправленный текст
+        self._pending = {}
+        # Сообщения, у которых правка ждет окна, стоит в очереди или отправляется
+        self._scheduled = set()
+        # Текст, который отправляется прямо сейчас
+        self._sending = {}
+        self._last_text = {}
+        self._lock = threading.Lock()
+        self._stats = {'requested': 0, 'sent': 0, 'skipped': 0}
+
+    def edit(self, text, chat_id, message_id, **kwargs):
+        """Ставит правку в очередь; вызов не ждет отправки"""
+        key = (_chat_key(chat_id), message_id)
+        with self._lock:
+            self._stats['requested'] += 1
+            self._pending[key] = (text, kwargs)
+            if key in self._scheduled:
+                return
+            self._scheduled.add(key)
+        self.call_later(self.window, self._flush, key)
+
+    def forget(self, chat_id, message_id):
+        """Забывает сообщение (после удаления)"""
+        key = (_chat_key(chat_id), message_id)
+        with self._lock:
+            self._pending.pop(key, None)
+            self._last_text.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def _set_last_text(self, key, text):
+        self._last_text.pop(key, None)
+        self._last_text[key] = text
+        while len(self._last_text) > self.max_tracked:
+            del self._last_text[next(iter(self._last_text))]
+
+    def _flush(self, key):
+        """Ставит в очередь отправки одну правку сообщения"""
+        with self._lock:
+            if key not in self._pending:
+                self._scheduled.discard(key)
+                return
+
+        chat_id, message_id = key
+        future = self.outbound.submit(PRIORITY_EDIT, chat_id, self._send, key)
+        future.add_done_callback(lambda f: self._on_done(key, f))
+
+    def _send(self, key):
+        """Выполняется очередью отправки: отправляет последний запрошенный текст"""
+        with self._lock:
+            pending = self._pending.pop(key, None)
+            if pending is None:
+                return None
+            text, kwargs = pending
+            if self._last_text.get(key) == text:
+                self._stats['skipped'] += 1
+                return None
+            self._sending[key] = text
+
+        chat_id, message_id = key
+        try:
+            result = self.edit_func(text, chat_id, message_id, **kwargs)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                # Очередь повторит эту же правку; более новый текст важнее
+                with self._lock:
+                    self._sending.pop(key, None)
+                    self._pending.setdefault(key, pending)
+            raise
+        with self._lock:
+            self._stats['sent'] += 1
+        return result
+
+    def _on_done(self, key, future):
+        error = future.exception()
+        with self._lock:
+            text = self._sending.pop(key, None)
+            if text is not None and (error is None or 'message is not modified' in str(error)):
+                self._set_last_text(key, text)
+            # Пока правка ждала и отправлялась, мог прийти новый текст
+            again = key in self._pending
+            if not again:
+                self._scheduled.discard(key)
+        if error is not None and 'message is not modified' not in str(error):
+            print(f"Не удалось обновить сообщение {key}: {error}")
+        if again:
+            self._flush(key)
+
+
+class PacedTeleBot(telebot.TeleBot):
+    """TeleBot, у которого все исходящие сообщения идут через OutboundDispatcher"""
+
+    def __init__(self, token, outbound=None, call_later=None, **kwargs):
+        super().__init__(token, **kwargs)
+        self.outbound = outbound or OutboundDispatcher()
+        self.edits = EditCoalescer(self.outbound, super().edit_message_text, call_later=call_later)
+
+    def queue_edit(self, text, chat_id, message_id, **kwargs):
+        """Правка сообщения с дебаунсом: отправится только последний текст"""
+        self.edits.edit(text, chat_id, message_id, **kwargs)
+
+    def queue_message(self, chat_id, text, *args, **kwargs):
+        """Отправка сообщения без ожидания: возвращает Future"""
+        return self.outbound.submit(PRIORITY_SEND, chat_id, super().send_message, chat_id, text, *args, **kwargs)
+
+    def send_message(self, chat_id, text, *args, **kwargs):
+        return self.outbound.call(PRIORITY_SEND, chat_id, super().send_message, chat_id, text, *args, **kwargs)
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, *args, **kwargs):
+        return self.outbound.call(PRIORITY_EDIT, chat_id, super().edit_message_text,
+                                  text, chat_id, message_id, *args, **kwargs)
+
+    def delete_message(self, chat_id, message_id, *args, **kwargs):
+        return self.outbound.call(PRIORITY_EDIT, chat_id, super().delete_message,
+                                  chat_id, message_id, *args, **kwargs)
+
+    def answer_callback_query(self, callback_query_id, *args, **kwargs):
+        # Ответ на кнопку не считается сообщением в чат - только общий лимит
+        return self.outbound.call(PRIORITY_CALLBACK, None, super().answer_callback_query,
+                                  callback_query_id, *args, **kwargs)
+
+    def answer_inline_query(self, inline_query_id, *args, **kwargs):
+        # Пользователь ждет подсказки, пока печатает - тот же приоритет, что у кнопок
+        return self.outbound.call(PRIORITY_CALLBACK, None, super().answer_inline_query,
+                                  inline_query_id, *args, **kwargs)
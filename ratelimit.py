@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Ведро токенов: пополняется со скоростью rate токенов в секунду до capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Забирает токены. Возвращает 0, если получилось, иначе сколько секунд ждать"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Ждет, пока токены не появятся, и забирает их"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Запрещает выдачу токенов на seconds секунд (например, по retry_after)"""
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = 0
+            self._updated = self._blocked_until
+
+    def available(self):
+        """Сколько токенов доступно прямо сейчас"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return 0.0
+            self._refill(now)
+            return self._tokens
+
+    def is_full(self):
+        return self.available() >= self.capacity
@@ -0,0 +1,50 @@
+"""Локальная замена Telegram для проверки webhook без сети.
+
+Отправляет записанные апдейты (по одному JSON-объекту на строку или
+JSON-массив) POST-запросами на локальный webhook бота:
+
+    python bot.py --webhook
+    python replay_updates.py updates.jsonl
+"""
+import argparse
+import json
+import urllib.request
+
+from webhook import SECRET_HEADER, WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT
+
+
+def load_updates(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def post_update(url, update, secret_token=None):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update, ensure_ascii=False).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    if secret_token:
+        request.add_header(SECRET_HEADER, secret_token)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка записанных апдейтов на локальный webhook")
+    parser.add_argument('updates', help="файл с апдейтами (JSONL или JSON-массив)")
+    parser.add_argument('--url', default=f"http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument('--secret', default=None, help="значение WEBHOOK_SECRET, если он задан")
+    args = parser.parse_args()
+
+    for update in load_updates(args.updates):
+        status = post_update(args.url, update, args.secret)
+        print(f"update_id={update.get('update_id')}: HTTP {status}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+import re
+import threading
+from datetime import datetime
+
+PLAYERS_HEADER = "Игроки:"
+GOALIES_HEADER = "Вратари:"
+RESERVES_HEADER = "Резерв:"
+RESERVE_SUFFIX = "(резерв)"
+
+SECTION_NAMES = {
+    'players': 'основном составе',
+    'reserves': 'резерве',
+    'goalies': 'вратарях',
+}
+
+
+class Training:
+    """Состав тренировки, опубликованной отдельным сообщением.
+
+    Хранит дату, лимит и списки игроков/вратарей/резерва с user_id участников.
+    Текст сообщения собирается из модели методом render(), поэтому при
+    нажатии кнопок текст сообщения больше не разбирается построчно.
+    """
+
+    def __init__(self, chat_id, message_id, training_date, header_text, player_limit=0):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.training_date = training_date
+        self.header_text = header_text
+        self.player_limit = player_limit
+        self.players = []
+        self.goalies = []
+        self.reserves = []
+        self._members = {}
+
+    @property
+    def key(self):
+        return self.chat_id, self.message_id
+
+    @property
+    def date_str(self):
+        return self.training_date.strftime('%d.%m.%Y')
+
+    def _section(self, name):
+        return getattr(self, name)
+
+    def is_member(self, user_id):
+        """Записан ли пользователь в любой из списков"""
+        return str(user_id) in self._members
+
+    def section_of(self, user_id):
+        """Список, в котором записан пользователь, или None"""
+        return self._members.get(str(user_id))
+
+    def add(self, user_id, name, role='player'):
+        """Записывает пользователя и возвращает название списка.
+
+        Вратари записываются без лимита, игроки сверх лимита уходят в резерв.
+        """
+        if role == 'goalie':
+            section = 'goalies'
+        elif self.player_limit > 0 and len(self.players) >= self.player_limit:
+            section = 'reserves'
+        else:
+            section = 'players'
+
+        self._append(section, user_id, name)
+        return section
+
+    def _append(self, section, user_id, name):
+        user_id = str(user_id) if user_id else None
+        self._section(section).append({'user_id': user_id, 'name': name})
+        if user_id:
+            self._members[user_id] = section
+
+    def remove(self, user_id):
+        """Удаляет пользователя. Возвращает (список, номер в списке) или (None, None)"""
+        section = self._members.pop(str(user_id), None)
+        if section is None:
+            return None, None
+
+        entries = self._section(section)
+        for number, entry in enumerate(entries, 1):
+            if entry['user_id'] == str(user_id):
+                del entries[number - 1]
+                return section, number
+        return section, None
+
+    def promote_reserve(self, user_id):
+        """Переводит резервиста в основной состав. True - если он был в резерве"""
+        if self.section_of(user_id) != 'reserves':
+            return False
+
+        for i, entry in enumerate(self.reserves):
+            if entry['user_id'] == str(user_id):
+                del self.reserves[i]
+                self._append('players', entry['user_id'], entry['name'])
+                return True
+        return False
+
+    def render(self):
+        """Собирает текст сообщения о тренировке"""
+        lines = [self.header_text, PLAYERS_HEADER]
+        lines.extend(f"{i}. {entry['name']}" for i, entry in enumerate(self.players, 1))
+        lines.append(GOALIES_HEADER)
+        lines.extend(f"{i}. {entry['name']}" for i, entry in enumerate(self.goalies, 1))
+        lines.append(RESERVES_HEADER)
+        lines.extend(f"{i}. {entry['name']} {RESERVE_SUFFIX}" for i, entry in enumerate(self.reserves, 1))
+        return '\n'.join(lines)
+
+    def copy_to(self, chat_id, message_id):
+        """Копия состава для нового сообщения (перенос в другой чат)"""
+        training = Training(chat_id, message_id, self.training_date, self.header_text, self.player_limit)
+        for section in ('players', 'goalies', 'reserves'):
+            for entry in self._section(section):
+                training._append(section, entry['user_id'], entry['name'])
+        return training
+
+    @classmethod
+    def from_message(cls, message, resolve_user_id):
+        """Восстанавливает состав из текста сообщения.
+
+        Нужен для сообщений, опубликованных до перезапуска бота.
+        resolve_user_id - функция ФИО -> user_id.
+        """
+        text = message.text or ''
+        date_match = re.search(r'(\d{2}\.\d{2}\.\d{4})', text)
+        if not date_match:
+            raise ValueError("Не удалось определить дату тренировки")
+        training_date = datetime.strptime(date_match.group(1), '%d.%m.%Y')
+
+        limit_match = re.search(r'Лимит игроков:\s*(\d+)', text)
+        player_limit = int(limit_match.group(1)) if limit_match else 0
+
+        lines = text.split('\n')
+        headers = {PLAYERS_HEADER: 'players', GOALIES_HEADER: 'goalies', RESERVES_HEADER: 'reserves'}
+        start = next((i for i, line in enumerate(lines) if line.strip() == PLAYERS_HEADER), len(lines))
+
+        training = cls(message.chat.id, message.message_id, training_date,
+                       '\n'.join(lines[:start]), player_limit)
+
+        section = None
+        for line in lines[start:]:
+            line = line.strip()
+            if line in headers:
+                section = headers[line]
+                continue
+
+            entry_match = re.match(r'^\d+\.\s*(.+)$', line)
+            if section and entry_match:
+                name = entry_match.group(1).replace(RESERVE_SUFFIX, '').strip()
+                training._append(section, resolve_user_id(name), name)
+
+        return training
+
+
+class TrainingRegistry:
+    """Составы тренировок по ключу (chat_id, message_id).
+
+    Все изменения состава одной тренировки выполняются под её собственной
+    блокировкой (lock), поэтому одновременные нажатия не затирают друг
+    друга, а разные тренировки обрабатываются параллельно. Удаленный состав
+    остается отмеченным: нажатие, которое ждало блокировку, пока сообщение
+    переносили или удаляли, не восстановит его из текста сообщения.
+    """
+
+    def __init__(self, resolve_user_id, storage=None):
+        self.resolve_user_id = resolve_user_id
+        # storage - словарь для хранения составов (например, PersistentDict)
+        self._trainings = storage if storage is not None else {}
+        self._locks = {}
+        # Ключи удаленных составов (сообщение перенесено или удалено)
+        self._removed = set()
+        self._registry_lock = threading.Lock()
+
+    def lock(self, chat_id, message_id):
+        """Блокировка для изменений состава конкретной тренировки"""
+        with self._registry_lock:
+            return self._locks.setdefault((chat_id, message_id), threading.RLock())
+
+    def add(self, training):
+        with self._registry_lock:
+            self._removed.discard(training.key)
+            self._trainings[training.key] = training
+        return training
+
+    def save(self, training):
+        """Сохраняет состав после изменения"""
+        self.add(training)
+
+    def get(self, chat_id, message_id):
+        with self._registry_lock:
+            return self._trainings.get((chat_id, message_id))
+
+    def is_current(self, training):
+        """True, если состав все еще зарегистрирован (проверяется под блокировкой состава)"""
+        with self._registry_lock:
+            return self._trainings.get(training.key) is training
+
+    def get_for_message(self, message):
+        """Состав для сообщения; если его нет в памяти - разбирает текст один раз.
+
+        None - состав удален: сообщение уже перенесено или удалено.
+        """
+        key = (message.chat.id, message.message_id)
+        with self._registry_lock:
+            if key in self._removed:
+                return None
+            training = self._trainings.get(key)
+        if training is None:
+            training = Training.from_message(message, self.resolve_user_id)
+            with self._registry_lock:
+                if key in self._removed:
+                    return None
+                training = self._trainings.setdefault(training.key, training)
+        return training
+
+    def remove(self, chat_id, message_id):
+        """Удаляет состав. Блокировка остается: её могут держать или ждать другие потоки"""
+        with self._registry_lock:
+            self._removed.add((chat_id, message_id))
+            return self._trainings.pop((chat_id, message_id), None)
+
+    def restore(self, chat_id, message_id, training=None):
+        """Отменяет remove: возвращает состав (если он был в памяти) и снимает отметку удаления"""
+        with self._registry_lock:
+            self._removed.discard((chat_id, message_id))
+            if training is not None:
+                self._trainings[(chat_id, message_id)] = training
+
+
+class TrainingMessageIndex:
+    """Опубликованные сообщения тренировок по дате и обратно.
+
+    Заполняется в момент публикации, поэтому ни разбирать текст сообщений,
+    ни искать их в истории чата не нужно. storage - словарь
+    дата (ДД.ММ.ГГГГ) -> список {'chat_id', 'message_id'}; обратный индекс
+    (chat_id, message_id) -> дата строится в памяти при запуске.
+    """
+
+    def __init__(self, storage=None):
+        self._by_date = storage if storage is not None else {}
+        self._lock = threading.Lock()
+        self._by_message = {}
+        for date_str, messages in self._by_date.items():
+            for msg in messages:
+                self._by_message[(msg['chat_id'], msg['message_id'])] = date_str
+
+    def add(self, date_str, chat_id, message_id):
+        """Запоминает опубликованное сообщение тренировки на дату date_str"""
+        with self._lock:
+            if (chat_id, message_id) in self._by_message:
+                return
+            self._by_date[date_str] = self._by_date.get(date_str, []) + [
+                {'chat_id': chat_id, 'message_id': message_id}
+            ]
+            self._by_message[(chat_id, message_id)] = date_str
+
+    def messages_for(self, date_str):
+        """Список (chat_id, message_id) сообщений тренировки на дату"""
+        with self._lock:
+            return [(msg['chat_id'], msg['message_id']) for msg in self._by_date.get(date_str, [])]
+
+    def remove_message(self, chat_id, message_id):
+        with self._lock:
+            date_str = self._by_message.pop((chat_id, message_id), None)
+            if date_str is None:
+                return None
+            remaining = [
+                msg for msg in self._by_date.get(date_str, [])
+                if (msg['chat_id'], msg['message_id']) != (chat_id, message_id)
+            ]
+            if remaining:
+                self._by_date[date_str] = remaining
+            else:
+                self._by_date.pop(date_str, None)
+            return date_str
+
+    def remove_date(self, date_str):
+        """Забывает все сообщения тренировки и возвращает их список (chat_id, message_id)"""
+        with self._lock:
+            messages = self._by_date.pop(date_str, [])
+            for msg in messages:
+                self._by_message.pop((msg['chat_id'], msg['message_id']), None)
+            return [(msg['chat_id'], msg['message_id']) for msg in messages]
+
+    def dates(self):
+        with self._lock:
+            return list(self._by_date)
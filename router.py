@@ -0,0 +1,100 @@
+class _RouteNode:
+    __slots__ = ('children', 'handler', 'exact')
+
+    def __init__(self):
+        self.children = {}
+        self.handler = None
+        self.exact = False
+
+
+class CallbackRouter:
+    """Маршрутизация нажатий inline-кнопок по префиксу callback_data.
+
+    Префиксы хранятся в посимвольном дереве, поэтому поиск обработчика
+    проходит по callback_data один раз и не зависит от числа обработчиков.
+    Выигрывает самый длинный подходящий префикс. Формат callback_data не
+    меняется - кнопки в уже опубликованных сообщениях продолжают работать.
+    """
+
+    def __init__(self):
+        self._root = _RouteNode()
+        self.unhandled = 0
+
+    def route(self, prefix, exact=False):
+        """Декоратор: обработчик для callback_data, начинающихся с prefix.
+
+        exact=True - только для callback_data, равных prefix.
+        """
+        def decorator(handler):
+            node = self._root
+            for char in prefix:
+                node = node.children.setdefault(char, _RouteNode())
+            if node.handler is not None:
+                raise ValueError(f"Префикс '{prefix}' уже зарегистрирован")
+            node.handler = handler
+            node.exact = exact
+            return handler
+        return decorator
+
+    def resolve(self, data):
+        """Обработчик для callback_data или None"""
+        node = self._root
+        found = None
+        for char in data:
+            node = node.children.get(char)
+            if node is None:
+                return found
+            if node.handler is not None and not node.exact:
+                found = node.handler
+        if node.handler is not None:
+            return node.handler
+        return found
+
+    def dispatch(self, call):
+        handler = self.resolve(call.data or '')
+        if handler is None:
+            self.unhandled += 1
+            return
+        handler(call)
+
+    def install(self, bot):
+        """Подключает маршрутизатор к боту одним обработчиком"""
+        bot.callback_query_handler(func=lambda call: True)(self.dispatch)
+
+
+class MessageRouter:
+    """Маршрутизация текстовых сообщений, не попавших в команды.
+
+    Вместо цепочки фильтров, каждый из которых проверяется для каждого
+    сообщения, обработчик выбирается по шагу диалога пользователя
+    (step_of(message)) одним обращением к словарю.
+    """
+
+    def __init__(self, step_of):
+        self.step_of = step_of
+        self._by_step = {}
+
+    def on_step(self, step):
+        """Декоратор: обработчик сообщений пользователя, находящегося на шаге step"""
+        def decorator(handler):
+            self._by_step[step] = handler
+            return handler
+        return decorator
+
+    def resolve(self, message):
+        if not self._by_step:
+            return None
+        return self._by_step.get(self.step_of(message))
+
+    def dispatch(self, message):
+        handler = self.resolve(message)
+        if handler is not None:
+            handler(message)
+
+    def install(self, bot):
+        """Подключает маршрутизатор к боту.
+
+        Вызывается после регистрации всех команд: сюда попадают только
+        текстовые сообщения, которые не обработала ни одна команда.
+        """
+        bot.message_handler(func=lambda message: True, content_types=['text'])(self.dispatch)
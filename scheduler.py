@@ -0,0 +1,116 @@
+import heapq
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Сколько задач может выполняться одновременно (медленная задача не задерживает остальные)
+SCHEDULER_WORKERS = 2
+
+
+class ScheduledJob:
+    """Отложенное действие, которое можно отменить"""
+
+    def __init__(self, scheduler, job_id):
+        self.scheduler = scheduler
+        self.job_id = job_id
+
+    def cancel(self):
+        return self.scheduler.cancel(self.job_id)
+
+
+class Scheduler:
+    """Один поток для всех отложенных действий бота.
+
+    Дедлайны лежат в куче, поток спит до ближайшего из них, а наступившие
+    задачи выполняет небольшой постоянный пул, поэтому число потоков не
+    зависит от количества таймеров. Задачи, поставленные через schedule(),
+    сохраняются в storage и восстанавливаются после перезапуска; для этого
+    их обработчики регистрируются по имени через register().
+    """
+
+    def __init__(self, storage=None, workers=SCHEDULER_WORKERS):
+        self._storage = storage if storage is not None else {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scheduler-job')
+        self._handlers = {}
+        self._jobs = {}
+        self._heap = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def register(self, name, func):
+        """Регистрирует обработчик для сохраняемых задач"""
+        self._handlers[name] = func
+
+    def call_later(self, delay, func, *args):
+        """Вызывает func(*args) через delay секунд. Задача не сохраняется"""
+        return self._add(uuid.uuid4().hex, time.time() + delay, func, args)
+
+    def schedule(self, delay, name, *args):
+        """Вызывает зарегистрированный обработчик name через delay секунд.
+
+        Задача сохраняется и будет выполнена даже после перезапуска бота.
+        """
+        if name not in self._handlers:
+            raise ValueError(f"Обработчик '{name}' не зарегистрирован")
+        job_id = uuid.uuid4().hex
+        deadline = time.time() + delay
+        self._storage[job_id] = (deadline, name, args)
+        return self._add(job_id, deadline, name, args)
+
+    def cancel(self, job_id):
+        """Отменяет задачу. True - если она еще не была выполнена"""
+        with self._condition:
+            found = self._jobs.pop(job_id, None) is not None
+            self._storage.pop(job_id, None)
+            self._condition.notify()
+        return found
+
+    def pending_count(self):
+        with self._condition:
+            return len(self._jobs)
+
+    def start(self):
+        """Восстанавливает сохраненные задачи и запускает поток"""
+        if self._thread is not None:
+            return
+        for job_id, (deadline, name, args) in list(self._storage.items()):
+            if name in self._handlers:
+                self._add(job_id, deadline, name, args)
+            else:
+                print(f"Пропущена сохраненная задача без обработчика: {name}")
+                self._storage.pop(job_id, None)
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def _add(self, job_id, deadline, target, args):
+        with self._condition:
+            self._jobs[job_id] = (target, args)
+            heapq.heappush(self._heap, (deadline, job_id))
+            self._condition.notify()
+        return ScheduledJob(self, job_id)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    # Отмененные задачи просто пропускаем при извлечении из кучи
+                    while self._heap and self._heap[0][1] not in self._jobs:
+                        heapq.heappop(self._heap)
+                    if self._heap and self._heap[0][0] <= time.time():
+                        break
+                    self._condition.wait(self._heap[0][0] - time.time() if self._heap else None)
+
+                _, job_id = heapq.heappop(self._heap)
+                target, args = self._jobs.pop(job_id)
+                self._storage.pop(job_id, None)
+
+            func = self._handlers[target] if isinstance(target, str) else target
+            self._executor.submit(self._execute, func, args)
+
+    @staticmethod
+    def _execute(func, args):
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"Ошибка отложенной задачи {getattr(func, '__name__', func)}: {e}")
@@ -0,0 +1,287 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+OUTBOX_DB_FILE = 'sheets_outbox.sqlite3'
+
+# Как часто отправлять накопленные изменения в таблицу (секунды)
+FLUSH_INTERVAL = 5
+# Отправляем раньше, если накопилось столько изменений
+MAX_BATCH_SIZE = 50
+# Предельная пауза между повторами, пока таблица недоступна (секунды)
+MAX_RETRY_DELAY = 300
+
+REGISTRATION = 'registration'
+ATTENDANCE = 'attendance'
+CANCEL = 'cancel'
+
+
+class OutboxJournal:
+    """Журнал изменений таблицы, ожидающих записи.
+
+    Каждая запись имеет ключ идемпотентности: новая запись с тем же ключом
+    заменяет старую и встает в конец очереди. База пишется с синхронизацией
+    на диск при каждом коммите, поэтому принятое изменение переживает и
+    падение процесса, и отключение питания.
+    """
+
+    def __init__(self, path=OUTBOX_DB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL UNIQUE,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL"
+            ")"
+        )
+
+    def put(self, key, kind, payload):
+        self.put_many([(key, kind, payload)])
+
+    def put_many(self, entries):
+        """Записывает список (key, kind, payload) одной транзакцией"""
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO outbox (key, kind, payload) VALUES (?, ?, ?)",
+                    [(key, kind, json.dumps(payload, ensure_ascii=False)) for key, kind, payload in entries]
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def pending(self, kind=None, limit=None):
+        """Список (seq, kind, payload) в порядке поступления"""
+        query = "SELECT seq, kind, payload FROM outbox"
+        params = []
+        if kind is not None:
+            query += " WHERE kind = ?"
+            params.append(kind)
+        query += " ORDER BY seq"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+        return [(seq, kind, json.loads(payload)) for seq, kind, payload in rows]
+
+    def ack(self, seqs):
+        """Удаляет записанные изменения. Замененные за это время записи не трогаются"""
+        with self._lock:
+            self._connection.executemany("DELETE FROM outbox WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+class SheetsOutbox:
+    """Отложенная запись изменений в Google-таблицу через журнал.
+
+    Регистрации, отметки посещаемости и отмены тренировок сначала пишутся
+    в журнал, после чего пользователю можно сразу отвечать. Фоновый поток
+    отправляет журнал в таблицу пачками: подряд идущие изменения одного
+    вида уходят одним запросом. Запись подтверждается в журнале только
+    после успешной отправки, а при сбое повторяется с растущей паузой.
+    Повторная отправка безопасна: отметки и отмены идемпотентны, а
+    регистрация не добавляется, если user_id уже есть на листе.
+
+    Если передано локальное хранилище local, изменения сначала сразу
+    применяются к нему, а таблица gsheets служит отчетом, который
+    заполняется фоном (gsheets может быть None - тогда отчета нет).
+    """
+
+    def __init__(self, gsheets, journal, local=None, flush_interval=FLUSH_INTERVAL, max_batch_size=MAX_BATCH_SIZE):
+        self.gsheets = gsheets
+        self.journal = journal
+        self.local = local
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._urgent = False
+        self._thread = None
+        self._failures = 0
+
+        # Неотправленные регистрации должны быть видны в зеркале пользователей сразу
+        if local is None:
+            for _, _, payload in journal.pending(REGISTRATION):
+                gsheets.remember_user(payload['row'], pending=True)
+
+    def start(self):
+        """Запускает фоновый поток записи"""
+        if self._thread is not None:
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='sheets-outbox', daemon=True)
+        self._thread.start()
+
+    def submit_registration(self, user, message_text):
+        """Регистрирует пользователя: сразу в зеркале, в таблице - фоном"""
+        if self.local is not None:
+            row = self.local.build_user_row(user, message_text)
+            if not self.local.append_user_rows([row]):
+                return False
+        else:
+            row = self.gsheets.build_user_row(user, message_text)
+
+        if self.gsheets is not None:
+            self.journal.put(f"{REGISTRATION}:{user.id}", REGISTRATION, {'row': row})
+            if self.local is None:
+                self.gsheets.remember_user(row, pending=True)
+            self._wake(urgent=True)
+        return True
+
+    def submit_attendance(self, user_id, training_date, present=True, role=None):
+        """Ставит изменение посещаемости в очередь.
+
+        Повторные изменения для той же пары (пользователь, дата) заменяют
+        предыдущее - в таблицу уйдет только последнее состояние.
+        """
+        return self.submit_attendance_batch([(user_id, training_date, present, role)])
+
+    def submit_attendance_batch(self, changes):
+        """Ставит в очередь пачку изменений (user_id, training_date, present, role).
+
+        Вся пачка пишется в журнал одной транзакцией и уйдет в таблицу
+        одним запросом.
+        """
+        if self.local is not None and not self.local.update_attendance_batch(changes):
+            return False
+        if self.gsheets is None:
+            return True
+
+        entries = []
+        for user_id, training_date, present, role in changes:
+            date_str = training_date.strftime('%d.%m.%Y')
+            entries.append((f"{ATTENDANCE}:{user_id}:{date_str}", ATTENDANCE, {
+                'user_id': str(user_id),
+                'date': date_str,
+                'present': present,
+                'role': role
+            }))
+        self.journal.put_many(entries)
+        self._wake()
+        return True
+
+    def submit_cancel(self, training_date):
+        """Ставит в очередь удаление тренировки из графика посещений"""
+        if self.local is not None and self.local.cancel_training(training_date) is False:
+            return False
+        if self.gsheets is None:
+            return True
+
+        date_str = training_date.strftime('%d.%m.%Y')
+        self.journal.put(f"{CANCEL}:{date_str}", CANCEL, {'date': date_str})
+        self._wake(urgent=True)
+        return True
+
+    def pending_count(self):
+        """Количество изменений, ожидающих записи"""
+        return self.journal.count()
+
+    def _wake(self, urgent=False):
+        """Будит поток записи; urgent - отправить, не дожидаясь интервала"""
+        with self._condition:
+            self._urgent = self._urgent or urgent
+            self._condition.notify()
+
+    def flush(self):
+        """Отправляет накопленные изменения в таблицу. True - если журнал пуст"""
+        if self.gsheets is None:
+            return True
+        with self._flush_lock:
+            while True:
+                entries = self.journal.pending(limit=self.max_batch_size)
+                if not entries:
+                    self._failures = 0
+                    return True
+
+                # Подряд идущие изменения одного вида отправляются одним запросом
+                kind = entries[0][1]
+                run = []
+                for entry in entries:
+                    if entry[1] != kind:
+                        break
+                    run.append(entry)
+
+                try:
+                    # Пока таблица недоступна, изменения просто ждут в журнале
+                    breaker = getattr(self.gsheets, 'breaker', None)
+                    if breaker is not None and breaker.is_open():
+                        return False
+                    applied = self._apply(kind, [payload for _, _, payload in run])
+                except Exception as e:
+                    print(f"Ошибка записи журнала в таблицу: {e}")
+                    applied = False
+
+                if not applied:
+                    self._failures += 1
+                    return False
+                self.journal.ack([seq for seq, _, _ in run])
+
+    def _apply(self, kind, payloads):
+        if kind == REGISTRATION:
+            return self.gsheets.append_user_rows([payload['row'] for payload in payloads])
+
+        if kind == ATTENDANCE:
+            changes = [
+                (payload['user_id'], datetime.strptime(payload['date'], '%d.%m.%Y').date(),
+                 payload['present'], payload['role'])
+                for payload in payloads
+            ]
+            return self.gsheets.update_attendance_batch(changes)
+
+        if kind == CANCEL:
+            for payload in payloads:
+                training_date = datetime.strptime(payload['date'], '%d.%m.%Y').date()
+                # None - тренировки уже нет в таблице, повторять нечего
+                if self.gsheets.cancel_training(training_date) is False:
+                    return False
+            return True
+
+        print(f"Неизвестный вид изменения в журнале: {kind}")
+        return True
+
+    def retry_delay(self):
+        """Пауза перед следующей попыткой: растет вдвое после каждой неудачи"""
+        if not self._failures:
+            return self.flush_interval
+        return min(self.flush_interval * 2 ** self._failures, MAX_RETRY_DELAY)
+
+    def stop(self):
+        """Останавливает поток и отправляет остаток журнала"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # После неудачи ждем паузу целиком, иначе - до интервала или заполнения пачки
+                deadline = time.monotonic() + self.retry_delay()
+                while not self._stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if not self._failures and (self._urgent or self.journal.count() >= self.max_batch_size):
+                        break
+                    self._condition.wait(remaining)
+                if self._stopped:
+                    return
+                self._urgent = False
+            self.flush()
@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+
+from gspread.exceptions import APIError, GSpreadException
+
+from ratelimit import TokenBucket
+
+# Квоты Google Sheets API по умолчанию: запросов в минуту на пользователя
+READ_REQUESTS_PER_MINUTE = 60
+WRITE_REQUESTS_PER_MINUTE = 60
+
+# Повторы при 429 и ошибках сервера Google
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BASE_BACKOFF = 1   # секунды
+MAX_BACKOFF = 64   # секунды
+
+
+def api_status(error):
+    """HTTP-статус ответа Google API из исключения gspread"""
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+class SheetsQuota:
+    """Учет квоты Google Sheets API.
+
+    Чтения и записи расходуют отдельные ведра токенов. Когда квота
+    заканчивается, запрос ждет своей очереди, а не падает с 429. Ответы
+    429/5xx повторяются с экспоненциальной паузой со случайным разбросом.
+    Записи, которые нельзя повторять (write_once), повторяются только
+    после 429: при 5xx изменение могло уже примениться.
+    Если передан breaker, каждый вызов сообщает ему об успехе или сбое,
+    а при разомкнутой цепи запрос сразу получает CircuitOpenError.
+    """
+
+    def __init__(self, reads_per_minute=READ_REQUESTS_PER_MINUTE, writes_per_minute=WRITE_REQUESTS_PER_MINUTE,
+                 breaker=None):
+        self.breaker = breaker
+        self._buckets = {
+            'read': TokenBucket(reads_per_minute / 60, capacity=reads_per_minute),
+            'write': TokenBucket(writes_per_minute / 60, capacity=writes_per_minute),
+        }
+        self._lock = threading.Lock()
+        self._stats = {'read': 0, 'write': 0, 'retried': 0, 'failed': 0}
+
+    def read(self, func, *args, **kwargs):
+        """Выполняет запрос на чтение в рамках квоты"""
+        return self.call('read', func, *args, **kwargs)
+
+    def write(self, func, *args, **kwargs):
+        """Выполняет запрос на запись в рамках квоты"""
+        return self.call('write', func, *args, **kwargs)
+
+    def write_once(self, func, *args, **kwargs):
+        """Запись, которую нельзя повторять вслепую: вставка и удаление строк,
+        столбцов и листов. При 5xx ошибка сразу уходит вызывающему, который
+        перечитает лист и повторит операцию целиком.
+        """
+        return self._call('write', False, func, args, kwargs)
+
+    def call(self, kind, func, *args, **kwargs):
+        return self._call(kind, True, func, args, kwargs)
+
+    def _call(self, kind, idempotent, func, args, kwargs):
+        bucket = self._buckets[kind]
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            bucket.acquire()
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except APIError as e:
+                status = api_status(e)
+                if status not in RETRY_STATUSES:
+                    # Сервис ответил, ошибка в самом запросе
+                    self._record(True, started)
+                    self._count('failed')
+                    raise
+                self._record(False, started)
+                # 429 - запрос не выполнен; после 5xx - неизвестно, выполнен ли
+                if attempt >= MAX_RETRIES or (status != 429 and not idempotent):
+                    self._count('failed')
+                    raise
+
+                # Полный разброс: от нуля до экспоненциально растущего предела
+                delay = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+                if status == 429:
+                    bucket.pause(delay)
+                self._count('retried')
+                attempt += 1
+                time.sleep(delay)
+            except GSpreadException:
+                # WorksheetNotFound и подобные - ответ сервиса, а не сбой связи
+                self._record(True, started)
+                raise
+            except Exception:
+                # Таймауты и обрывы соединения
+                self._record(False, started)
+                self._count('failed')
+                raise
+            else:
+                self._record(True, started)
+                self._count(kind)
+                return result
+
+    def _record(self, success, started):
+        if self.breaker is None:
+            return
+        if success:
+            self.breaker.record_success(time.monotonic() - started)
+        else:
+            self.breaker.record_failure()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def remaining(self):
+        """Сколько запросов на чтение и запись доступно прямо сейчас"""
+        return {kind: int(bucket.available()) for kind, bucket in self._buckets.items()}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['remaining'] = self.remaining()
+        return stats
@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+
+from storage import Storage
+
+STORAGE_DB_FILE = 'storage.sqlite3'
+
+USER_COLUMNS = ['user_id', 'telegram_name', 'full_name', 'message', 'registration_date', 'is_admin']
+
+
+class SqliteStorage(Storage):
+    """Локальное хранилище пользователей и посещаемости в SQLite.
+
+    Работает без сети и credentials.json: все чтения идут из зеркала в
+    памяти, а запись - это одна транзакция на локальном диске.
+    """
+
+    def __init__(self, path=STORAGE_DB_FILE):
+        super().__init__()
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            " user_id TEXT PRIMARY KEY,"
+            " telegram_name TEXT NOT NULL DEFAULT '',"
+            " full_name TEXT NOT NULL DEFAULT '',"
+            " message TEXT NOT NULL DEFAULT '',"
+            " registration_date TEXT NOT NULL DEFAULT '',"
+            " is_admin TEXT NOT NULL DEFAULT ''"
+            ")"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS attendance ("
+            " user_id TEXT NOT NULL,"
+            " training_date TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " PRIMARY KEY (user_id, training_date)"
+            ") WITHOUT ROWID"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS attendance_by_date ON attendance (training_date)"
+        )
+        self.reload_users()
+
+    def _query(self, sql, params=()):
+        with self._db_lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def reload_users(self):
+        """Загружает всех пользователей в зеркало"""
+        self._load_user_rows(self._query(f"SELECT {', '.join(USER_COLUMNS[:5])} FROM users"))
+        return True
+
+    def refresh_users(self):
+        # Все изменения проходят через этот же процесс - зеркало всегда актуально
+        return True
+
+    def get_all_records(self):
+        """Все записи пользователей со всеми полями"""
+        rows = self._query(f"SELECT {', '.join(USER_COLUMNS)} FROM users ORDER BY rowid")
+        return [dict(zip(USER_COLUMNS, row)) for row in rows]
+
+    def append_user_rows(self, rows):
+        """Добавляет пользователей; уже существующие user_id пропускаются.
+
+        В зеркало попадают вставленные строки, а для пропущенных - то, что
+        уже лежит в базе, а не присланные значения.
+        """
+        try:
+            with self._db_lock:
+                self._connection.execute("BEGIN")
+                try:
+                    written = []
+                    skipped = []
+                    for row in rows:
+                        values = [str(value) for value in (list(row) + [''] * 5)[:5]]
+                        cursor = self._connection.execute(
+                            "INSERT OR IGNORE INTO users (user_id, telegram_name, full_name, message, registration_date)"
+                            " VALUES (?, ?, ?, ?, ?)",
+                            values
+                        )
+                        if cursor.rowcount:
+                            written.append(values)
+                        else:
+                            skipped.append(values[0])
+                    if skipped:
+                        written.extend(self._connection.execute(
+                            f"SELECT {', '.join(USER_COLUMNS[:5])} FROM users"
+                            f" WHERE user_id IN ({', '.join('?' * len(skipped))})",
+                            skipped
+                        ).fetchall())
+                    self._connection.execute("COMMIT")
+                except Exception:
+                    self._connection.execute("ROLLBACK")
+                    raise
+            self._users_written(written)
+            return True
+        except sqlite3.Error as e:
+            print(f"Ошибка при добавлении записи: {e}")
+            return False
+
+    def update_attendance_batch(self, changes):
+        """Применяет пачку изменений посещаемости одной транзакцией"""
+        try:
+            with self._db_lock:
+                self._connection.execute("BEGIN")
+                try:
+                    for user_id, training_date, present, role in changes:
+                        date_str = training_date.strftime('%Y-%m-%d')
+                        if present:
+                            self._connection.execute(
+                                "INSERT OR REPLACE INTO attendance (user_id, training_date, value) VALUES (?, ?, ?)",
+                                (str(user_id), date_str, self._attendance_value(present, role))
+                            )
+                        else:
+                            self._connection.execute(
+                                "DELETE FROM attendance WHERE user_id = ? AND training_date = ?",
+                                (str(user_id), date_str)
+                            )
+                    self._connection.execute("COMMIT")
+                except Exception:
+                    self._connection.execute("ROLLBACK")
+                    raise
+            return True
+        except sqlite3.Error as e:
+            print(f"Ошибка обновления посещаемости: {e}")
+            return False
+
+    def cancel_training(self, training_date):
+        """Удаляет все отметки тренировки"""
+        try:
+            with self._db_lock:
+                cursor = self._connection.execute(
+                    "DELETE FROM attendance WHERE training_date = ?", (training_date.strftime('%Y-%m-%d'),)
+                )
+            return True if cursor.rowcount else None
+        except sqlite3.Error as e:
+            print(f"Ошибка отмены тренировки: {e}")
+            return False
@@ -0,0 +1,101 @@
+import pickle
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+
+STATE_DB_FILE = 'bot_state.sqlite3'
+
+
+class StateStore:
+    """Локальное хранилище состояния бота в SQLite.
+
+    Журнал в режиме WAL: запись не блокирует чтение и переживает
+    перезапуск процесса. Значения хранятся в pickle, ключ - пара
+    (пространство имен, ключ) с первичным индексом.
+    """
+
+    def __init__(self, path=STATE_DB_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL,"
+            " key BLOB NOT NULL,"
+            " value BLOB NOT NULL,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+
+    def load(self, namespace):
+        """Все пары (ключ, значение) пространства имен"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key, value FROM state WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        return [(pickle.loads(key), pickle.loads(value)) for key, value in rows]
+
+    def put(self, namespace, key, value):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)",
+                (namespace, pickle.dumps(key), pickle.dumps(value))
+            )
+
+    def delete(self, namespace, key):
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ?",
+                (namespace, pickle.dumps(key))
+            )
+
+    def clear(self, namespace):
+        with self.lock:
+            self.connection.execute("DELETE FROM state WHERE namespace = ?", (namespace,))
+
+    def dict(self, namespace):
+        """Словарь, сохраняемый в этом хранилище"""
+        return PersistentDict(self, namespace)
+
+
+class PersistentDict(MutableMapping):
+    """Словарь с кэшем в памяти, каждое изменение которого пишется в SQLite.
+
+    Чтение идет только из памяти. Если значение изменено на месте
+    (например, вложенный словарь), его нужно сохранить вызовом save(key).
+    """
+
+    def __init__(self, store, namespace):
+        self.store = store
+        self.namespace = namespace
+        self._data = dict(store.load(namespace))
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        with self.store.lock:
+            self._data[key] = value
+            self.store.put(self.namespace, key, value)
+
+    def __delitem__(self, key):
+        with self.store.lock:
+            del self._data[key]
+            self.store.delete(self.namespace, key)
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def save(self, key):
+        """Сохраняет значение, измененное на месте"""
+        with self.store.lock:
+            if key in self._data:
+                self.store.put(self.namespace, key, self._data[key])
@@ -0,0 +1,232 @@
+import re
+import threading
+from datetime import datetime
+
+from name_index import MAX_COMPLETIONS, NameIndex, PrefixTrie
+
+
+class Storage:
+    """Общая часть хранилищ пользователей и посещаемости.
+
+    Поиск пользователей всегда идет по зеркалу в памяти, которое ведет
+    этот класс. Наследники (Google-таблица, локальная SQLite) загружают
+    зеркало из своего источника и реализуют запись:
+
+    - reload_users() / refresh_users() - перечитать пользователей в зеркало
+    - is_users_stale() - отдается ли зеркало из устаревшего снимка
+    - get_all_records() - все записи пользователей со всеми полями
+    - append_user_rows(rows) - идемпотентно добавить строки пользователей
+    - update_attendance_batch(changes) - применить пачку изменений посещаемости
+    - cancel_training(training_date) - удалить тренировку из посещаемости:
+      True - удалена, None - такой тренировки нет, False - ошибка записи
+    """
+
+    def __init__(self):
+        self._users_lock = threading.RLock()
+        self._users_by_id = {}
+        self._names = NameIndex()
+        # Автодополнение ФИО по префиксу (inline-поиск игроков)
+        self._completions = PrefixTrie()
+        # Зарегистрированные, но еще не записанные в хранилище пользователи
+        self._pending_users = {}
+        # user_id, которых точно не было в последнем свежем снимке пользователей
+        self._unregistered = set()
+
+    def users_stats(self):
+        """Размеры зеркала пользователей"""
+        with self._users_lock:
+            return {
+                'users': len(self._users_by_id),
+                'pending': len(self._pending_users),
+                'unregistered': len(self._unregistered),
+            }
+
+    def _index_user_row(self, row):
+        """Добавляет строку пользователя в индексы зеркала"""
+        if not row or not str(row[0]).strip():
+            return
+        row = [str(value) for value in row] + [''] * (4 - len(row))
+        record = {
+            'user_id': row[0],
+            'telegram_name': row[1],
+            'full_name': row[2],
+            'message': row[3]
+        }
+        previous = self._users_by_id.get(record['user_id'])
+        if previous and previous['message']:
+            self._names.remove(previous['message'], previous['user_id'])
+            self._completions.remove(previous['message'], previous['user_id'])
+        self._users_by_id[record['user_id']] = record
+        self._unregistered.discard(record['user_id'])
+        if record['message']:
+            self._names.add(record['message'], record['user_id'])
+            self._completions.add(record['message'], record['user_id'])
+
+    def _load_user_rows(self, rows):
+        """Заменяет зеркало строками из источника, сохраняя неотправленные регистрации"""
+        with self._users_lock:
+            self._users_by_id = {}
+            self._names = NameIndex()
+            self._completions = PrefixTrie()
+            for row in rows:
+                self._index_user_row(row)
+            for row in self._pending_users.values():
+                if str(row[0]) not in self._users_by_id:
+                    self._index_user_row(row)
+
+    def is_users_stale(self):
+        """True, если зеркало пользователей отдается из старого снимка"""
+        return False
+
+    @staticmethod
+    def get_full_name(user):
+        """Объединяет имя и фамилию пользователя"""
+        first_name = user.first_name or ""
+        last_name = user.last_name or ""
+        return f"{first_name} {last_name}".strip()
+
+    def is_user_exists(self, user_id):
+        """Проверяет существование пользователя по ID"""
+        key = str(user_id)
+        with self._users_lock:
+            if key in self._users_by_id:
+                return True
+            # Запоминаем отсутствие, только если снимок свежий
+            if not self.is_users_stale():
+                self._unregistered.add(key)
+            return False
+
+    def is_known_unregistered(self, user_id):
+        """True, если пользователя точно нет: его не было в свежем снимке.
+
+        Позволяет отвечать незарегистрированным из памяти, даже когда
+        зеркало устарело и источник недоступен. Сбрасывается, как только
+        пользователь появляется в зеркале (регистрация, дочитка таблицы).
+        """
+        with self._users_lock:
+            return str(user_id) in self._unregistered
+
+    def build_user_row(self, user, message_text):
+        """Строка записи для нового пользователя"""
+        return [
+            str(user.id),
+            user.username or "",
+            self.get_full_name(user),
+            message_text,
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ]
+
+    def remember_user(self, row, pending=False):
+        """Отражает строку пользователя в зеркале.
+
+        pending - строка еще не записана в хранилище: она переживет полную
+        перезагрузку зеркала, пока не будет записана append_user_rows.
+        """
+        with self._users_lock:
+            self._index_user_row(row)
+            if pending:
+                self._pending_users[str(row[0])] = row
+
+    def _users_written(self, rows, skipped_ids=()):
+        """Отмечает строки пользователей записанными в хранилище.
+
+        skipped_ids - user_id, которые уже были в хранилище: их строки не
+        записаны, поэтому в зеркало не попадают, а просто перестают ждать записи.
+        """
+        with self._users_lock:
+            for row in rows:
+                self._index_user_row(row)
+                self._pending_users.pop(str(row[0]), None)
+            for user_id in skipped_ids:
+                self._pending_users.pop(str(user_id), None)
+
+    def add_record(self, user, message_text):
+        """Добавляет запись пользователя"""
+        row = self.build_user_row(user, message_text)
+        # Сразу отражаем новую запись в зеркале
+        self.remember_user(row, pending=True)
+        return self.append_user_rows([row])
+
+    def get_user_record(self, user_id):
+        """Возвращает запись пользователя по ID из зеркала"""
+        with self._users_lock:
+            record = self._users_by_id.get(str(user_id))
+            return dict(record) if record else None
+
+    def forget_unregistered(self, user_id):
+        """Снимает отметку "точно не зарегистрирован" (пользователь начал регистрацию)"""
+        with self._users_lock:
+            self._unregistered.discard(str(user_id))
+
+    def get_user_id_by_name(self, message):
+        """Возвращает user_id по ФИО пользователя из зеркала.
+
+        None - если такого ФИО нет или оно есть у нескольких пользователей.
+        """
+        with self._users_lock:
+            return self._names.get(message)
+
+    @staticmethod
+    def clean_name(name):
+        """Очищает строку списка игроков от нумерации и лишних символов"""
+        clean_name = re.sub(r'^\d+\.?\s*', '', name.strip())  # Удаляем нумерацию (1., 2 и т.д.)
+        return re.sub(r'[^a-zA-Zа-яА-ЯёЁ\s]', '', clean_name).strip()
+
+    def resolve_names(self, names):
+        """Сопоставляет список ФИО с пользователями за один проход.
+
+        Все имена ищутся в одном и том же снимке зеркала (одна блокировка
+        на весь список). Возвращает список пар (ФИО, список user_id): пустой -
+        игрок не зарегистрирован, больше одного - ФИО есть у нескольких.
+        """
+        with self._users_lock:
+            result = []
+            for name in names:
+                result.append((name, self._names.lookup(name)))
+        return result
+
+    def search_users(self, prefix, limit=MAX_COMPLETIONS):
+        """Записи пользователей, ФИО которых начинается с prefix (с любого слова)"""
+        with self._users_lock:
+            return [dict(self._users_by_id[user_id]) for user_id in self._completions.search(prefix, limit)]
+
+    def similar_names(self, name):
+        """Похожие ФИО зарегистрированных: список (ФИО, user_id, похожесть)"""
+        with self._users_lock:
+            return self._names.similar(name)
+
+    def find_user_by_name(self, name):
+        """Ищет пользователя по ФИО с очисткой строки и кэшированием"""
+        try:
+            # Очищаем имя от лишних символов и нумерации
+            clean_name = self.clean_name(name)
+
+            if not clean_name:
+                return None
+
+            # Используем существующую логику поиска
+            user_id = self.get_user_id_by_name(clean_name)
+
+            if user_id:
+                return {
+                    'user_id': user_id,
+                    'full_name': clean_name
+                }
+            return None
+
+        except Exception as e:
+            print(f"Ошибка поиска пользователя по имени: {e}")
+            return None
+
+    @staticmethod
+    def _attendance_value(present, role):
+        """Значение отметки посещаемости с учетом роли"""
+        if not present:
+            return ''
+        if role == 'goalie':
+            return 'G'  # Отметка для вратарей
+        return '1'  # Обычное посещение
+
+    def update_attendance(self, user_id, training_date, present=True, role=None):
+        """Обновляет посещаемость с учетом роли (player/goalie)"""
+        return self.update_attendance_batch([(user_id, training_date, present, role)])
@@ -0,0 +1,50 @@
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip('telebot')
+pytest.importorskip('gspread')
+pytest.importorskip('oauth2client')
+
+
+def make_config():
+    """config.py с минимальными значениями: локальное хранилище, без Google"""
+    config = types.ModuleType('config')
+    config.TELEGRAM_TOKEN = '123456:TEST'
+    config.ADMIN_IDS = []
+    config.CONFIG_ADMINS = []
+    config.NOTIFICATION_TO = []
+    config.TRAINING_CHAT_ID_STAGING = -1
+    config.TRAINING_CHAT_ID_TEST = -2
+    config.TRAINING_CHAT_ID_PROD = -3
+    config.BIG_CHAT_ID_TEST = -4
+    config.BIG_CHAT_ID_PROD = -5
+    config.SPREADSHEET_ID = 'test'
+    config.WORKSHEET_NAME = 'Users'
+    config.ATTENDANCE_SHEET_NAME = 'Attendance'
+    config.DEFAULT_TEMPLATES = {'default': 'Тренировка {date}'}
+    config.STORAGE_BACKEND = 'sqlite'
+    config.SHEETS_REPORT = False
+    return config
+
+
+def test_bot_module_imports(tmp_path, monkeypatch):
+    """bot.py импортируется целиком: весь код уровня модуля выполняется при старте"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(sys.modules, 'config', make_config())
+    for name in ('bot', 'gsheets', 'templates_manager'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    bot = importlib.import_module('bot')
+    try:
+        assert bot.scheduler is not None
+        assert bot.storage.get_all_records() == []
+    finally:
+        bot.sheets_outbox.stop()
+        monkeypatch.delitem(sys.modules, 'bot', raising=False)
@@ -0,0 +1,37 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from name_index import NameIndex  # noqa: E402
+
+
+def test_lookup_ignores_case_and_word_order():
+    index = NameIndex()
+    index.add("Иванов Пётр", '1')
+    assert index.get("петр ИВАНОВ") == '1'
+    assert index.lookup("Иванов Петр") == ['1']
+
+
+def test_namesakes_are_ambiguous():
+    index = NameIndex()
+    index.add("Иванов Иван", '1')
+    index.add("Иван Иванов", '2')
+
+    assert sorted(index.lookup("Иванов Иван")) == ['1', '2']
+    assert index.get("Иванов Иван") is None
+
+
+def test_removing_namesake_keeps_the_other():
+    index = NameIndex()
+    index.add("Иванов Иван", '1')
+    index.add("Иванов Иван", '2')
+    index.remove("Иванов Иван", '1')
+
+    assert index.get("Иванов Иван") == '2'
+    assert [user_id for _, user_id, _ in index.similar("Иванов Иваан")] == ['2']
+
+    index.remove("Иванов Иван", '2')
+    assert index.lookup("Иванов Иван") == []
+    assert index.similar("Иванов Иван") == []
@@ -0,0 +1,79 @@
+import os
+import sys
+from concurrent.futures import Future
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip('telebot')
+
+from outbound import EditCoalescer  # noqa: E402
+
+
+class FakeOutbound:
+    """Очередь отправки, которую тест прокручивает вручную"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, priority, chat_id, func, *args, **kwargs):
+        future = Future()
+        self.jobs.append((future, func, args, kwargs))
+        return future
+
+    def run_next(self):
+        future, func, args, kwargs = self.jobs.pop(0)
+        future.set_result(func(*args, **kwargs))
+
+
+def make_coalescer():
+    outbound = FakeOutbound()
+    sent = []
+    coalescer = EditCoalescer(
+        outbound,
+        lambda text, chat_id, message_id, **kwargs: sent.append(text),
+        call_later=lambda delay, func, *args: func(*args)
+    )
+    return coalescer, outbound, sent
+
+
+def test_one_queued_edit_sends_latest_text():
+    coalescer, outbound, sent = make_coalescer()
+    for i in range(40):
+        coalescer.edit(f"состав {i}", -100, 1)
+
+    assert len(outbound.jobs) == 1
+    outbound.run_next()
+    assert sent == ["состав 39"]
+    assert outbound.jobs == []
+
+
+def test_edit_during_send_is_queued_once_more():
+    coalescer, outbound, sent = make_coalescer()
+
+    def edit_func(text, chat_id, message_id, **kwargs):
+        sent.append(text)
+        if text == "состав 1":
+            # Новый текст приходит, пока предыдущая правка отправляется
+            coalescer.edit("состав 2", chat_id, message_id)
+
+    coalescer.edit_func = edit_func
+    coalescer.edit("состав 1", -100, 1)
+    outbound.run_next()
+    assert sent == ["состав 1"]
+    assert len(outbound.jobs) == 1
+
+    outbound.run_next()
+    assert sent == ["состав 1", "состав 2"]
+
+
+def test_same_text_is_skipped():
+    coalescer, outbound, sent = make_coalescer()
+    coalescer.edit("состав", -100, 1)
+    outbound.run_next()
+    coalescer.edit("состав", -100, 1)
+    outbound.run_next()
+    assert sent == ["состав"]
+    assert coalescer.stats()['skipped'] == 1
@@ -0,0 +1,42 @@
+import os
+import sys
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from roster import Training, TrainingRegistry  # noqa: E402
+
+
+def make_message(chat_id, message_id, training):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id, text=training.render())
+
+
+def test_click_waiting_on_moved_roster_is_rejected():
+    registry = TrainingRegistry(lambda name: None)
+    training = registry.add(Training(-3, 10, datetime(2026, 11, 5), "Тренировка 05.11.2026", 10))
+    message = make_message(-3, 10, training)
+    result = {}
+
+    def click():
+        with registry.lock(-3, 10):
+            found = registry.get_for_message(message)
+            result['training'] = found
+            if found is not None:
+                found.add('42', 'Иванов Иван')
+
+    with registry.lock(-3, 10):
+        clicker = threading.Thread(target=click)
+        clicker.start()
+        # Перенос предзаписи: новый состав, старый удаляется под блокировкой
+        moved = registry.add(training.copy_to(-5, 20))
+        registry.remove(-3, 10)
+    clicker.join()
+
+    assert result['training'] is None
+    assert registry.get(-3, 10) is None
+    assert moved.players == []
+    assert not registry.is_current(training)
+    assert registry.is_current(moved)
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+gspread = pytest.importorskip('gspread')
+requests = pytest.importorskip('requests')
+
+import sheets_quota  # noqa: E402
+from sheets_quota import SheetsQuota  # noqa: E402
+
+
+def api_error(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = b'{"error": {"code": %d, "message": "error", "status": "ERROR"}}' % status
+    return gspread.exceptions.APIError(response)
+
+
+def failing(*statuses):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(statuses):
+            raise api_error(statuses[len(calls) - 1])
+        return 'ok'
+    return func, calls
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(sheets_quota.time, 'sleep', lambda seconds: None)
+
+
+def test_write_retries_server_errors():
+    func, calls = failing(503)
+    assert SheetsQuota().write(func) == 'ok'
+    assert len(calls) == 2
+
+
+def test_write_once_does_not_repeat_after_server_error():
+    func, calls = failing(503)
+    with pytest.raises(gspread.exceptions.APIError):
+        SheetsQuota().write_once(func)
+    assert len(calls) == 1
+
+
+def test_write_once_retries_rate_limit():
+    func, calls = failing(429)
+    quota = SheetsQuota()
+    quota._buckets['write'].pause = lambda seconds: None
+    assert quota.write_once(func) == 'ok'
+    assert len(calls) == 2
@@ -0,0 +1,20 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlite_storage import SqliteStorage  # noqa: E402
+
+
+def test_existing_user_keeps_stored_values(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'storage.sqlite3'))
+    assert storage.append_user_rows([['1', 'ivan', 'Ivan', 'Иванов Иван', '2025-01-01']])
+
+    # Повторная регистрация с другими данными не перезаписывает пользователя
+    storage.remember_user(['1', 'other', 'Other', 'Другое Имя', '2025-01-02'], pending=True)
+    assert storage.append_user_rows([['1', 'other', 'Other', 'Другое Имя', '2025-01-02']])
+
+    assert storage.get_user_record('1')['message'] == 'Иванов Иван'
+    assert storage.get_user_id_by_name('Другое Имя') is None
+    assert storage.get_user_id_by_name('Иванов Иван') == '1'
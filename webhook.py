@@ -0,0 +1,61 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+# Типы апдейтов, которые обрабатывает бот - остальные Telegram не присылает
+ALLOWED_UPDATES = ['message', 'callback_query', 'inline_query']
+
+WEBHOOK_LISTEN = '127.0.0.1'
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = '/telegram'
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    server_version = 'ArmadaBookingBot'
+
+    def do_POST(self):
+        server = self.server
+        if self.path != server.path:
+            self.send_error(404)
+            return
+        if server.secret_token and self.headers.get(SECRET_HEADER) != server.secret_token:
+            self.send_error(403)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            # json.loads принимает байты, а Update.de_json использует словарь без копирования
+            update = types.Update.de_json(json.loads(self.rfile.read(length)))
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Некорректный апдейт во входящем webhook: {e}")
+            self.send_error(400)
+            return
+
+        # Отвечаем сразу: апдейт обрабатывается в дорожках, а не в HTTP-потоке
+        server.dispatch([update])
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # Не засоряем вывод строкой на каждый апдейт
+        pass
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """Встроенный HTTP-сервер, принимающий апдейты Telegram через webhook.
+
+    dispatch - функция, которой передается список апдейтов
+    (например, LanePool.dispatch).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, dispatch, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH, secret_token=None):
+        super().__init__((host, port), _WebhookHandler)
+        self.dispatch = dispatch
+        self.path = path
+        self.secret_token = secret_token